@@ -0,0 +1,257 @@
+# coding: utf-8
+"""Microbenchmarks for flake8-holvi.
+
+Synthetic modules that are dense in the triggers of a given check are
+generated and HolviVisitor is timed on them, both with only that check
+enabled and with all checks enabled. Results are stored in
+JSON so that they can be compared against a previous run:
+
+    $ python bench_flake8_holvi.py --output baseline.json
+    $ python bench_flake8_holvi.py --compare baseline.json --threshold 0.1
+
+The second command exits with status code 1 if any benchmark got slower
+than the given threshold.
+"""
+from __future__ import print_function
+
+import argparse
+import ast
+import gc
+import json
+import platform
+import sys
+import time
+
+from flake8_holvi import HolviVisitor
+from flake8_holvi import __version__
+
+PY3 = sys.version_info[0] == 3
+
+# Check code - (kind of module, snippet).
+# Snippets are function bodies and '{i}' is replaced with a unique number.
+RULES = {
+    'HLVE006': ('service', "logger.info('Processing %s' % item_{i})"),
+    'HLVE007': ('service', "logger.error('Failed {{}}'.format(item_{i}))"),
+    'HLVE008': ('service', (
+        "for event in events_{i}:\n"
+        "    transaction.on_commit(lambda: task.apply_async((event.id,)))"
+    )),
+    'HLVE009': ('service', "logging.debug('Value of item_{i}: %s')"),
+    'HLVE010': ('service', "logging.exception('Failed to process item_{i}')"),
+    'HLVE012': ('service', (
+        "for event in events_{i}:\n"
+        "    transaction.on_commit(lambda user=user: task.apply_async((event.id, user.email)))"
+    )),
+    'HLVE013': ('view', (
+        "def helper_{i}():\n"
+        "    ''''''\n"
+        "    return {i}"
+    )),
+    'HLVE014': ('test', "self.assertListEqual(result_{i}, expected)"),
+    'HLVE015': ('test', "self.assertEquals(result_{i}, expected)"),
+    'HLVE016': ('test', "assert result_{i} is not None"),
+    'HLVE301': ('view', "print 'value_{i}'"),
+    'HLVE302': ('view', "value_{i} = unicode(request.GET['q'])"),
+    'HLVE303': ('view', "value_{i} = str(request.GET['q'])"),
+    'HLVE309': ('view', "import urlparse"),
+    'HLVE310': ('test', "self.assertItemsEqual(result_{i}, expected)"),
+    'HLVE311': ('view', "from models import Model{i}"),
+    'HLVE312': ('test', (
+        "expected_{i} = u'value {i}'\n"
+        "self.assertIn(expected_{i}, response.content)"
+    )),
+    'HLVE313': ('service', (
+        "try:\n"
+        "    process(item_{i})\n"
+        "except Exception as exc:\n"
+        "    logger.warning(exc.message)"
+    )),
+    'HLVE314': ('view', "for key, value in data_{i}.iteritems():\n    pass"),
+    'HLVW301': ('view', "value_{i} = unicode('välue {i}')"),
+}
+
+# Checks that can only be triggered when running under Python 2.
+PY2_ONLY_RULES = {'HLVE301', 'HLVE312'}
+
+# Code that doesn't trigger any check. It's mixed with the snippets to make
+# the modules look more realistic.
+FILLER = (
+    "items = [item for item in queryset if item.is_active]\n"
+    "context = {{'items': items, 'count': len(items), 'page': {i}}}\n"
+    "if not items:\n"
+    "    return None"
+)
+
+HEADERS = {
+    'view': (
+        "from django.http import HttpResponse\n"
+        "from django.shortcuts import render\n"
+    ),
+    'test': (
+        "from django.test import TestCase\n"
+    ),
+    'service': (
+        "import logging\n"
+        "\n"
+        "logger = logging.getLogger(__name__)\n"
+    ),
+}
+
+
+def _indent(text, prefix):
+    return '\n'.join(prefix + line if line else line for line in text.splitlines())
+
+
+def _render(template, i):
+    return template.replace('{i}', str(i)).replace('{{', '{').replace('}}', '}')
+
+
+def generate_module(kind, snippets, size=200):
+    """Generate a module of the given *kind* with *size* functions.
+
+    Every function contains all *snippets* mixed with code that doesn't
+    trigger any check. *kind* is one of 'view', 'test' or 'service'.
+    """
+    parts = [HEADERS[kind]]
+    if kind == 'test':
+        parts.append('\nclass GeneratedTestCase(TestCase):\n')
+    for i in range(size):
+        body = '\n'.join(_render(s, i) for s in snippets + (FILLER,))
+        if kind == 'test':
+            parts.append(_indent('def test_%d(self):\n' % i, '    '))
+            parts.append(_indent(body, '        ') + '\n\n')
+        elif kind == 'view':
+            parts.append('\ndef view_%d(request):\n' % i)
+            parts.append(_indent(body, '    ') + '\n\n')
+        else:
+            parts.append('\ndef process_%d(item_%d):\n' % (i, i))
+            parts.append(_indent(body, '    ') + '\n\n')
+    return '\n'.join(parts)
+
+
+def available_rules():
+    return sorted(code for code in RULES if PY3 is False or code not in PY2_ONLY_RULES)
+
+
+def generate_corpus(size=200, rules=None):
+    """Return a mapping of benchmark names to (source, codes) pairs.
+
+    There is a module per check and a mixed module per kind of module.
+    *codes* is None for benchmarks that use all checks.
+    """
+    if rules is None:
+        rules = available_rules()
+    corpus = {}
+    mixed = {}
+    for code in rules:
+        kind, snippet = RULES[code]
+        corpus[code] = (generate_module(kind, (snippet,), size), (code,))
+        mixed.setdefault(kind, []).append(snippet)
+    for kind, snippets in sorted(mixed.items()):
+        corpus['all:%s' % kind] = (generate_module(kind, tuple(snippets), size), None)
+    return corpus
+
+
+def _best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def run_benchmarks(size=200, repeat=5, rules=None):
+    corpus = generate_corpus(size, rules)
+    results = {}
+    for name, (source, codes) in sorted(corpus.items()):
+        tree = ast.parse(source)
+
+        def visit(codes=codes, tree=tree):
+            visitor = HolviVisitor(enabled_codes=codes)
+            visitor.visit(tree)
+            return visitor
+
+        visitor = visit()
+        results[name] = {
+            'lines': source.count('\n'),
+            'violations': len(visitor.violations),
+            'parse': _best_of(lambda source=source: ast.parse(source), repeat),
+            'visit': _best_of(visit, repeat),
+        }
+        if codes is not None:
+            # Also time all checks on the same module.
+            results[name]['visit_all'] = _best_of(
+                lambda tree=tree: HolviVisitor().visit(tree),
+                repeat,
+            )
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'size': size,
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """Return a list of (name, metric, old, new) tuples for regressions."""
+    regressions = []
+    for name, metrics in sorted(current['results'].items()):
+        old_metrics = baseline['results'].get(name)
+        if old_metrics is None:
+            continue
+        for metric in ('visit', 'visit_all'):
+            if metric not in metrics or metric not in old_metrics:
+                continue
+            old, new = old_metrics[metric], metrics[metric]
+            if old > 0 and new > old * (1 + threshold):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run flake8-holvi benchmarks.')
+    parser.add_argument('--size', type=int, default=200, help='Number of functions per module.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs per benchmark.')
+    parser.add_argument('--rules', default=None, help='Comma-separated list of checks to run.')
+    parser.add_argument('--output', default=None, help='Write results to this JSON file.')
+    parser.add_argument('--compare', default=None, help='Compare results to this JSON file.')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='Allowed slowdown when comparing results. (Default: %(default)s)',
+    )
+    options = parser.parse_args(argv)
+
+    rules = options.rules.split(',') if options.rules else None
+    current = run_benchmarks(options.size, options.repeat, rules)
+    for name, metrics in sorted(current['results'].items()):
+        line = '%-12s %6d lines %6d violations  parse %.4fs  visit %.4fs' % (
+            name, metrics['lines'], metrics['violations'], metrics['parse'], metrics['visit'],
+        )
+        if 'visit_all' in metrics:
+            line += '  visit (all checks) %.4fs' % metrics['visit_all']
+        print(line)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, current, options.threshold)
+        for name, metric, old, new in regressions:
+            print(
+                'REGRESSION: %s %s %.4fs -> %.4fs (+%.0f%%)' % (
+                    name, metric, old, new, (new / old - 1) * 100,
+                ),
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
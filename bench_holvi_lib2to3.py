@@ -0,0 +1,121 @@
+# coding: utf-8
+"""Benchmark of the holvi_lib2to3 rewriting engine.
+
+A corpus of modules with __future__ imports is generated and refactored
+both with the lib2to3 based fixers and with holvi_lib2to3.rewrite:
+
+    $ python bench_holvi_lib2to3.py --files 50 --size 200
+
+The outputs of both engines are compared and the command exits with
+status code 1 if they differ. lib2to3 was removed in Python 3.13, so
+there only the new engine is timed.
+"""
+from __future__ import print_function
+
+import argparse
+import sys
+import warnings
+
+import bench_flake8_holvi
+from bench_flake8_holvi import _best_of
+from holvi_lib2to3.rewrite import FixFuture
+from holvi_lib2to3.rewrite import Rewriter
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore')
+    try:
+        from lib2to3.refactor import RefactoringTool
+    except ImportError:
+        RefactoringTool = None
+
+FUTURE_IMPORTS = (
+    '# coding: utf-8\n'
+    'from __future__ import absolute_import\n'
+    'from __future__ import print_function, unicode_literals  # Comment\n'
+    '\n'
+)
+
+# Tab and form feed indentation and whitespace.
+WHITESPACE_BLOCK = (
+    '\x0c\n'
+    'if TYPE_CHECKING:\n'
+    '\timport typing\n'
+    '\n'
+)
+
+
+def generate_corpus(files=50, size=200):
+    """Return a list of (name, source) pairs. Sources are unicode."""
+    kinds = ('view', 'test', 'service')
+    corpus = []
+    for i in range(files):
+        kind = kinds[i % len(kinds)]
+        kind_rules = tuple(
+            snippet for code, (rule_kind, snippet) in sorted(bench_flake8_holvi.RULES.items())
+            if rule_kind == kind and code not in bench_flake8_holvi.PY2_ONLY_RULES
+        )
+        source = bench_flake8_holvi.generate_module(kind, kind_rules, size)
+        if isinstance(source, bytes):
+            # Python 2.
+            source = source.decode('utf-8')
+        # Every fourth module has nothing to remove. Like in lib2to3,
+        # nothing is removed from modules with CRLF line endings either.
+        if i % 4 == 0:
+            source = FUTURE_IMPORTS + source
+        elif i % 4 == 2:
+            source = (FUTURE_IMPORTS + source).replace('\n', '\r\n')
+        elif i % 4 == 3:
+            source = FUTURE_IMPORTS + WHITESPACE_BLOCK + source
+        corpus.append(('module_%d.py' % i, source))
+    return corpus
+
+
+def run_lib2to3(corpus):
+    tool = RefactoringTool(['holvi_lib2to3.fixes.fix_future'])
+    return [
+        # Like the 2to3 tool, add a newline and remove it from the result.
+        # str() of a tree would encode it to ASCII in Python 2.
+        (u'%s' % tool.refactor_string(source + u'\n', name))[:-1]
+        for name, source in corpus
+    ]
+
+
+def run_rewrite(corpus):
+    rewriter = Rewriter([FixFuture()])
+    return [rewriter.refactor(source) for name, source in corpus]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark holvi_lib2to3 engines.')
+    parser.add_argument('--files', type=int, default=50, help='Number of modules.')
+    parser.add_argument('--size', type=int, default=200, help='Number of functions per module.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per engine.')
+    options = parser.parse_args(argv)
+
+    corpus = generate_corpus(options.files, options.size)
+    lines = sum(source.count('\n') for name, source in corpus)
+    print('%d files, %d lines' % (len(corpus), lines))
+
+    rewrite_time = _best_of(lambda: run_rewrite(corpus), options.repeat)
+    print('rewrite  %.4fs' % rewrite_time)
+    if RefactoringTool is None:
+        print('lib2to3 is not available')
+        return 0
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        lib2to3_time = _best_of(lambda: run_lib2to3(corpus), options.repeat)
+        expected = run_lib2to3(corpus)
+    print('lib2to3  %.4fs (%.1fx slower)' % (lib2to3_time, lib2to3_time / rewrite_time))
+
+    differences = [
+        name for (name, source), old, new in zip(corpus, expected, run_rewrite(corpus))
+        if old != new
+    ]
+    for name in differences:
+        print('DIFFERENCE: %s' % name, file=sys.stderr)
+    return int(bool(differences))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,22 @@
 # coding: utf-8
+from __future__ import print_function
 
 import ast
+import atexit
+import bisect
+import collections
+import copy
+import fnmatch
+import itertools
+import os
+import re
+import sys
+import time
+import tokenize
 
-import pycodestyle
+# flake8 imports the plugin in every worker process. Modules that only some
+# code paths need, like pycodestyle, hashlib, subprocess, tempfile and the
+# modules of the standalone runner, are imported where they are used.
 
 __version__ = '0.5.3'
 
@@ -45,7 +59,8 @@ deprecated_unittest_assertions = {
     'assertEquals': 'assertEqual',
 }
 
-# TODO: make this configurable via CLI or flake8 config.
+# Extended with --holvi-relative-imports and replaced by the modules found
+# next to the checked file with --holvi-discover-relative-imports.
 potential_implicit_relative_imports = {
     'forms',
     'exceptions',
@@ -66,6 +81,822 @@ python2_builtin_methods = {
     'iteritems',
 }
 
+# Exceptions that have a message attribute (HLVE313) by module and class
+# name. Their subclasses in the checked project are found with
+# --holvi-project-index.
+known_message_exceptions = {
+    # Django's ValidationError has a message attribute.
+    ('django.core.exceptions', 'ValidationError'),
+}
+
+
+# Maximum number of parsed trees kept by parse_source().
+PARSE_CACHE_SIZE = 64
+
+_parse_cache = collections.OrderedDict()
+
+
+def source_digest(source):
+    """Return a stable hash of *source* to be used as a cache key."""
+    import hashlib
+
+    if not isinstance(source, bytes):
+        source = source.encode('utf-8')
+    return hashlib.sha1(source).hexdigest()
+
+
+def parse_source(source):
+    """Parse *source* and cache the tree by the hash of its contents.
+
+    Callers that check the same source more than once (e.g. editors
+    re-checking an unchanged buffer) get the same tree back without
+    parsing it again. Trees must be treated as read-only.
+    """
+    key = source_digest(source)
+    try:
+        tree = _parse_cache.pop(key)
+    except KeyError:
+        tree = ast.parse(source)
+        if len(_parse_cache) >= PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    _parse_cache[key] = tree
+    return tree
+
+
+class ResultCache(object):
+    """On-disk cache of violations keyed by source contents and settings.
+
+    Every entry is stored in its own file so that parallel flake8 workers
+    can share the cache directory. Entries are written to a temporary file
+    first and then renamed over the final path, which is atomic on POSIX.
+    Reading an entry bumps its modification time, and the least recently
+    used entries are removed once there are more than *max_entries* of them.
+    The directory is only listed when the number of entries may exceed
+    *max_entries* and after every tenth of *max_entries* writes, because
+    other workers write to it too.
+    """
+
+    suffix = '.json'
+
+    def __init__(self, directory, max_entries=10000):
+        self.directory = directory
+        self.max_entries = max_entries
+        # Estimated number of entries and writes since they were counted.
+        self._entries = None
+        self._writes = 0
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another worker may have created it in the meantime.
+                if not os.path.isdir(directory):
+                    raise
+
+    @staticmethod
+    def make_key(source, settings):
+        import json
+
+        return source_digest(source_digest(source) + json.dumps(settings, sort_keys=True))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        import json
+
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                violations = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return violations
+
+    def set(self, key, violations):
+        import json
+        import tempfile
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(violations, f)
+            # os.replace() doesn't exist in Python 2.
+            getattr(os, 'replace', os.rename)(temp_path, self._path(key))
+        except (IOError, OSError):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        self._writes += 1
+        if self._entries is not None:
+            self._entries += 1
+        if (
+            self._entries is None or
+            self._entries > self.max_entries or
+            self._writes >= self.max_entries // 10
+        ):
+            self.prune()
+
+    def prune(self):
+        self._writes = 0
+        try:
+            names = [n for n in os.listdir(self.directory) if n.endswith(self.suffix)]
+        except OSError:
+            return
+        self._entries = len(names)
+        if len(names) <= self.max_entries:
+            return
+        entries = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                # Already removed by another worker.
+                continue
+        entries.sort()
+        # Evict a bit more than necessary so that we don't need to do this
+        # after every write.
+        excess = len(entries) - int(self.max_entries * 0.9)
+        self._entries = len(entries) - max(excess, 0)
+        for _, path in entries[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ModuleIndex(object):
+    """Map package directories to the names of the modules in them.
+
+    Every directory is listed at most once per process. The index can be
+    filled in advance with index_files() and passed to worker processes.
+    """
+
+    def __init__(self):
+        self.modules = {}
+
+    def get_modules(self, directory):
+        """Return a frozenset of modules and packages in *directory*.
+
+        The set is empty if *directory* isn't a package.
+        """
+        directory = os.path.abspath(directory)
+        modules = self.modules.get(directory)
+        if modules is None:
+            modules = self.modules[directory] = self._scan(directory)
+        return modules
+
+    def index_files(self, paths):
+        for directory in set(os.path.dirname(os.path.abspath(path)) for path in paths):
+            self.get_modules(directory)
+
+    @staticmethod
+    def _scan(directory):
+        if not os.path.isfile(os.path.join(directory, '__init__.py')):
+            return frozenset()
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return frozenset()
+        modules = set()
+        for name in names:
+            if name.endswith('.py'):
+                if name != '__init__.py':
+                    modules.add(name[:-3])
+            elif os.path.isfile(os.path.join(directory, name, '__init__.py')):
+                modules.add(name)
+        return frozenset(modules)
+
+
+def _to_bytes(text):
+    return text if isinstance(text, bytes) else text.encode('utf-8')
+
+
+def _module_name(path, is_package):
+    """Return the dotted name of the module in *path*.
+
+    *is_package* is called with directories to find out whether they
+    contain an __init__.py file.
+    """
+    directory, filename = os.path.split(os.path.abspath(path))
+    parts = [] if filename == '__init__.py' else [os.path.splitext(filename)[0]]
+    while is_package(directory):
+        directory, package = os.path.split(directory)
+        if not package:
+            break
+        parts.append(package)
+    return '.'.join(reversed(parts))
+
+
+def _resolve_module(module, package):
+    """Return the absolute name of *module* imported in *package* or None.
+
+    Relative module names start with dots.
+    """
+    if not module.startswith('.'):
+        return module
+    name = module.lstrip('.')
+    parts = package.split('.') if package else []
+    up = len(module) - len(name) - 1
+    if up > len(parts):
+        return None
+    parts = parts[:len(parts) - up]
+    if name:
+        parts.append(name)
+    return '.'.join(parts) or None
+
+
+_class_re = re.compile(r'^class[ \t]+(\w+)[ \t]*\(([^)]*)\)', re.M)
+_import_from_re = re.compile(r'^from[ \t]+(\.*[\w.]*)[ \t]+import[ \t]+(\([^)]*\)|[^\n]*)', re.M)
+_comment_re = re.compile(r'#[^\n]*')
+
+
+def _match_lines(regex, source, keyword):
+    """Yield matches of *regex* at the lines of *source* that start with *keyword*.
+
+    Finding the lines with str.find() is several times faster than
+    letting the regex scan the whole source.
+    """
+    if source.startswith(keyword):
+        position = 0
+    else:
+        position = source.find('\n' + keyword) + 1
+        if not position:
+            return
+    while True:
+        match = regex.match(source, position)
+        if match is not None:
+            yield match
+        position = source.find('\n' + keyword, position) + 1
+        if not position:
+            return
+
+
+def _scan_classes(source, module, package):
+    """Return a mapping of top-level classes in *source* to their bases.
+
+    Classes and bases are (module, name) pairs. The source is scanned with
+    regular expressions instead of being parsed, so only the usual
+    'from x import y' and 'class X(y.Z):' forms are understood.
+    """
+    imports = {}
+    for match in _match_lines(_import_from_re, source, 'from'):
+        imported_module = _resolve_module(match.group(1), package)
+        if imported_module is None:
+            continue
+        names = _comment_re.sub('', match.group(2)).strip('()\\ \t\n')
+        for name in names.split(','):
+            words = name.split()
+            if len(words) == 1:
+                imports[words[0]] = (imported_module, words[0])
+            elif len(words) == 3 and words[1] == 'as':
+                imports[words[2]] = (imported_module, words[0])
+    classes = {}
+    for match in _match_lines(_class_re, source, 'class'):
+        bases = []
+        for base in _comment_re.sub('', match.group(2)).split(','):
+            base = base.strip()
+            head, _, rest = base.partition('.')
+            if not head or '=' in base:
+                continue
+            if head in imports:
+                imported_module, name = imports[head]
+                if not rest:
+                    bases.append((imported_module, name))
+                    continue
+                base = '%s.%s.%s' % (imported_module, name, rest)
+            elif not rest:
+                # A class of the same module.
+                bases.append((module, head))
+                continue
+            base_module, _, name = base.rpartition('.')
+            bases.append((base_module, name))
+        classes[(module, match.group(1))] = bases
+    return classes
+
+
+class ProjectIndex(object):
+    """Read-only index of the packages and exception classes of a project.
+
+    build() scans the project once and writes the index to a file of
+    sorted lines. Every process maps the file into memory and finds lines
+    with a binary search, so lookups need neither filesystem access nor
+    parsing. Only the path of the file is pickled when the index is sent
+    to worker processes. It can be used in place of a ModuleIndex.
+    """
+
+    # Lines are tab-separated. 'm' lines map package directories to their
+    # dotted names and comma-separated lists of modules. 'x' lines are
+    # exceptions that have a message attribute by module and class name.
+    header = b'# flake8-holvi project index 1\n'
+
+    def __init__(self, path):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        import mmap
+
+        with open(self.path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(self.header)] != self.header:
+            raise ValueError('%s is not a flake8-holvi project index' % self.path)
+        # Directories that aren't in the index.
+        self._scanned = {}
+        self._exception_classes = None
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._open()
+
+    @classmethod
+    def build(cls, paths, path, exclude=None):
+        """Index the Python files in *paths* and write the index to *path*.
+
+        Return a ProjectIndex of the written file.
+        """
+        if exclude is None:
+            exclude = DEFAULT_EXCLUDE
+        packages = {}
+
+        def is_package(directory):
+            try:
+                return packages[directory]
+            except KeyError:
+                result = packages[directory] = os.path.isfile(
+                    os.path.join(directory, '__init__.py')
+                )
+                return result
+
+        lines = set()
+        classes = {}
+        directories = set()
+        for filename in discover_files(paths, exclude):
+            directory = os.path.dirname(os.path.abspath(filename))
+            directories.add(directory)
+            module = _module_name(filename, is_package)
+            if os.path.basename(filename) == '__init__.py':
+                package = module
+            else:
+                package = module.rpartition('.')[0]
+            try:
+                with open(filename, 'rb') as f:
+                    source = f.read().decode('utf-8', 'replace')
+            except (IOError, OSError):
+                continue
+            classes.update(_scan_classes(source, module, package))
+        for directory in directories:
+            package = _module_name(os.path.join(directory, '__init__.py'), is_package)
+            modules = ModuleIndex._scan(directory)
+            lines.add(b'\t'.join([
+                b'm', _to_bytes(directory), _to_bytes(package),
+                _to_bytes(','.join(sorted(modules))),
+            ]))
+
+        # Subclasses of exceptions with a message attribute have it too.
+        known = set(known_message_exceptions)
+        changed = True
+        while changed:
+            changed = False
+            for key, bases in classes.items():
+                if key not in known and any(base in known for base in bases):
+                    known.add(key)
+                    changed = True
+        for module, name in known - known_message_exceptions:
+            lines.add(b'\t'.join([b'x', _to_bytes(module), _to_bytes(name)]))
+
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(cls.header)
+            for line in sorted(lines):
+                f.write(line + b'\n')
+        # os.replace() doesn't exist in Python 2.
+        getattr(os, 'replace', os.rename)(temp_path, path)
+        return cls(path)
+
+    def _find(self, prefix):
+        """Return the offset of the first line that is greater than or equal to *prefix*."""
+        data = self._data
+        low = len(self.header)
+        high = len(data)
+        while low < high:
+            middle = (low + high) // 2
+            # Lines always start after a newline since the header ends with one.
+            start = data.rfind(b'\n', 0, middle) + 1
+            end = data.find(b'\n', start)
+            if data[start:end] < prefix:
+                low = end + 1
+            else:
+                high = start
+        return low
+
+    def _lookup(self, prefix):
+        """Return the first line that is greater than or equal to *prefix*."""
+        start = self._find(prefix)
+        if start >= len(self._data):
+            return None
+        return self._data[start:self._data.find(b'\n', start)]
+
+    def _package_line(self, directory):
+        prefix = b'm\t' + _to_bytes(directory) + b'\t'
+        line = self._lookup(prefix)
+        if line is None or not line.startswith(prefix):
+            return None
+        return line[len(prefix):].decode('utf-8').split('\t')
+
+    def get_modules(self, directory):
+        """Return a frozenset of modules and packages in *directory*.
+
+        Directories that aren't in the index are listed once per process
+        like in ModuleIndex.
+        """
+        directory = os.path.abspath(directory)
+        fields = self._package_line(directory)
+        if fields is not None:
+            return frozenset(fields[1].split(',')) if fields[1] else frozenset()
+        modules = self._scanned.get(directory)
+        if modules is None:
+            modules = self._scanned[directory] = ModuleIndex._scan(directory)
+        return modules
+
+    def index_files(self, paths):
+        """Files are indexed by build(), so this does nothing."""
+
+    def is_message_exception(self, module, name):
+        line = b'\t'.join([b'x', _to_bytes(module), _to_bytes(name)])
+        return self._lookup(line) == line
+
+    def get_package(self, filename):
+        """Return the dotted name of the package that contains *filename*."""
+        directory = os.path.dirname(os.path.abspath(filename))
+        fields = self._package_line(directory)
+        if fields is not None:
+            return fields[0]
+        return _module_name(os.path.join(directory, '__init__.py'), lambda d: (
+            os.path.isfile(os.path.join(d, '__init__.py'))
+        ))
+
+    def get_message_exceptions(self, filename):
+        """Return the exceptions with a message attribute as seen from *filename*.
+
+        The result is a container of (module, name) pairs like
+        known_message_exceptions where modules can be relative module names.
+        """
+        return _ProjectMessageExceptions(self, self.get_package(filename))
+
+    def get_message_exception_classes(self):
+        """Return a mapping of class names to the modules that define them.
+
+        Only exceptions with a message attribute are included. The mapping
+        is read once per process.
+        """
+        if self._exception_classes is None:
+            classes = {}
+            data = self._data
+            start = self._find(b'x\t')
+            while start < len(data):
+                end = data.find(b'\n', start)
+                fields = data[start:end].decode('utf-8').split('\t')
+                if fields[0] != 'x':
+                    break
+                classes.setdefault(fields[2], []).append(fields[1])
+                start = end + 1
+            self._exception_classes = classes
+        return self._exception_classes
+
+
+class _ProjectMessageExceptions(object):
+
+    def __init__(self, index, package):
+        self.index = index
+        self.package = package
+
+    def __contains__(self, item):
+        module = _resolve_module(item[0], self.package)
+        if module is None:
+            return False
+        return (
+            (module, item[1]) in known_message_exceptions or
+            self.index.is_message_exception(module, item[1])
+        )
+
+
+_hunk_header_re = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+_quoted_char_re = re.compile(br'\\(?:([0-7]{3})|(.))')
+_quoted_chars = {
+    b'a': b'\a', b'b': b'\b', b'f': b'\f', b'n': b'\n', b'r': b'\r', b't': b'\t', b'v': b'\v',
+}
+
+
+def _unquote_path(path):
+    """Return *path* from a diff header without the quotes of git.
+
+    Paths with special or, unless core.quotePath is off, non-ASCII
+    characters are quoted like C strings, with UTF-8 bytes as octal escapes.
+    """
+    if not (path.startswith('"') and path.endswith('"')):
+        return path
+
+    def unescape(match):
+        if match.group(1) is not None:
+            return bytes(bytearray([int(match.group(1), 8)]))
+        return _quoted_chars.get(match.group(2), match.group(2))
+
+    return _quoted_char_re.sub(unescape, path[1:-1].encode('utf-8')).decode('utf-8', 'replace')
+
+
+def parse_diff(diff, root):
+    """Return a mapping of absolute paths to changed line ranges.
+
+    *diff* is the output of 'git diff -U0' with the default 'b/' prefix
+    and *root* is the top level directory of the repository. Line ranges
+    are sorted, inclusive
+    (start, end) tuples. Deleted lines are reported as the line that
+    precedes them, which is what 'git diff -U0' puts in the hunk header,
+    or as line 1 if they were at the start of the file.
+    """
+    changed_lines = {}
+    ranges = None
+    for line in diff.splitlines():
+        if line.startswith('+++ '):
+            path = _unquote_path(line[4:].rstrip('\t'))
+            if path == '/dev/null':
+                ranges = None
+            else:
+                if path.startswith('b/'):
+                    path = path[2:]
+                path = os.path.normpath(os.path.join(root, path))
+                ranges = changed_lines.setdefault(path, [])
+            continue
+        match = _hunk_header_re.match(line)
+        if match is not None and ranges is not None:
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count == 0:
+                ranges.append((max(start, 1), max(start, 1)))
+            else:
+                ranges.append((start, start + count - 1))
+    for ranges in changed_lines.values():
+        ranges.sort()
+    return changed_lines
+
+
+def get_changed_lines(revision_range, cwd=None):
+    """Run 'git diff' for *revision_range* and return the changed lines."""
+    import subprocess
+
+    root = subprocess.check_output(
+        ['git', 'rev-parse', '--show-toplevel'], cwd=cwd,
+    ).decode('utf-8').strip()
+    # Override the configuration of the user that changes the paths in the
+    # headers, like diff.mnemonicPrefix, diff.noprefix and diff.relative.
+    diff = subprocess.check_output(
+        [
+            'git', '-c', 'core.quotePath=off', '-c', 'diff.relative=false',
+            'diff', '--no-color', '--no-ext-diff', '--src-prefix=a/', '--dst-prefix=b/',
+            '-U0', revision_range, '--',
+        ],
+        cwd=cwd,
+    ).decode('utf-8', 'replace')
+    return parse_diff(diff, root)
+
+
+def lines_overlap(ranges, start, end):
+    """Return True if any of the sorted *ranges* overlaps start..end."""
+    index = bisect.bisect_right(ranges, (end, sys.maxsize))
+    # Only the last range that starts before *end* can overlap because
+    # hunks don't overlap each other.
+    return index > 0 and ranges[index - 1][1] >= start
+
+
+def _statement_start(stmt):
+    decorators = getattr(stmt, 'decorator_list', None)
+    if decorators:
+        return min(stmt.lineno, min(d.lineno for d in decorators))
+    return stmt.lineno
+
+
+def _statement_ranges(body, last_line):
+    """Return inclusive (start, end) line ranges of the statements in *body*.
+
+    A statement ends where the next one starts, so comments and blank lines
+    belong to the statement above them.
+    """
+    starts = [_statement_start(stmt) for stmt in body]
+    ends = [start - 1 for start in starts[1:]] + [last_line]
+    return list(zip(starts, ends))
+
+
+def _is_docstring(stmt):
+    return isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Str)
+
+
+def _node_types(*names):
+    # Some node types (e.g. AsyncFunctionDef) only exist in Python 3.
+    return tuple(getattr(ast, name) for name in names if hasattr(ast, name))
+
+
+def _ast_node_types():
+    for value in vars(ast).values():
+        if isinstance(value, type) and issubclass(value, ast.AST):
+            yield value
+
+
+# Nodes that start a new scope. Assignments inside them don't bind names
+# in the enclosing function.
+_scope_node_types = _node_types('FunctionDef', 'AsyncFunctionDef', 'ClassDef', 'Lambda')
+
+_comprehension_types = _node_types('ListComp', 'SetComp', 'DictComp', 'GeneratorExp')
+
+# Scopes that lambdas inside them can't see the loop variables of
+# enclosing loops through.
+_function_types = _node_types('FunctionDef', 'AsyncFunctionDef', 'Lambda')
+
+_binding_loop_types = _node_types('For', 'AsyncFor') + _comprehension_types
+
+# Nodes whose children iter_violations() visits one statement at a time.
+_block_types = tuple(
+    node_type for node_type in _ast_node_types()
+    if issubclass(node_type, _node_types('stmt', 'excepthandler', 'match_case')) and
+    'body' in node_type._fields
+)
+
+
+def _collect_names(nodes, loaded, stored):
+    """Add the names used in *nodes* to *loaded* and *stored* by context.
+
+    *loaded* is a list in the order of appearance. Names of nested
+    lambdas that are bound by their parameters or inside them aren't
+    included. It's a lot faster than ast.walk().
+    """
+    pending = list(reversed(nodes))
+    while pending:
+        node = pending.pop()
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Store):
+                stored.add(node.id)
+            elif node.id not in loaded:
+                loaded.append(node.id)
+            continue
+        if isinstance(node, ast.Lambda):
+            defaults = node.args.defaults + [
+                default for default in getattr(node.args, 'kw_defaults', []) if default is not None
+            ]
+            _collect_names(defaults, loaded, stored)
+            lambda_loaded = []
+            lambda_stored = set(_argument_names(node.args))
+            _collect_names([node.body], lambda_loaded, lambda_stored)
+            for name in lambda_loaded:
+                if name not in lambda_stored and name not in loaded:
+                    loaded.append(name)
+            continue
+        for field in reversed(node._fields):
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                pending.extend(item for item in reversed(value) if isinstance(item, ast.AST))
+            elif isinstance(value, ast.AST):
+                pending.append(value)
+
+
+def _bound_names(node):
+    """Return the names that the targets of a for loop or a comprehension bind."""
+    if isinstance(node, _comprehension_types):
+        targets = [generator.target for generator in node.generators]
+    elif isinstance(node.target, ast.Name):
+        return frozenset([node.target.id])
+    else:
+        targets = [node.target]
+    names = set()
+    _collect_names(targets, [], names)
+    return frozenset(names)
+
+
+def _argument_names(args):
+    """Return the names of the parameters in an ast.arguments node."""
+    names = set()
+    for arg in (
+        getattr(args, 'posonlyargs', []) + args.args + getattr(args, 'kwonlyargs', [])
+    ):
+        # Parameters are Name nodes in Python 2.
+        names.add(getattr(arg, 'arg', None) or getattr(arg, 'id', None))
+    for arg in (args.vararg, args.kwarg):
+        if arg is not None:
+            names.add(getattr(arg, 'arg', arg))
+    return names
+
+
+def _imported_names(node):
+    """Return (module, name, local name) tuples of the names imported by an
+    ImportFrom node.
+
+    Modules of relative imports start with dots.
+    """
+    module = '.' * (node.level or 0) + (node.module or '')
+    return [(module, alias.name, alias.asname or alias.name) for alias in node.names]
+
+
+def collect_string_literals(body):
+    """Return a mapping of names to string literals assigned to them.
+
+    All statements in *body* are scanned, including nested blocks such as
+    if, for and try statements, but not nested functions and classes.
+    """
+    bindings = {}
+    pending = list(body)
+    while pending:
+        stmt = pending.pop(0)
+        if isinstance(stmt, _scope_node_types):
+            continue
+        if isinstance(stmt, ast.Assign):
+            if isinstance(stmt.value, ast.Str):
+                for target in stmt.targets:
+                    if isinstance(target, ast.Name):
+                        bindings.setdefault(target.id, []).append(stmt.value.s)
+            continue
+        for field in ('body', 'orelse', 'finalbody', 'handlers', 'cases'):
+            pending.extend(getattr(stmt, field, ()))
+    return bindings
+
+
+def _word_patterns(names):
+    return tuple(r'\b%s\b' % re.escape(name) for name in names)
+
+
+_word_re = re.compile(r'\w+')
+_word_trigger_re = re.compile(r'\\b((?:\\?\w)+)\\b$')
+
+
+class SourcePrefilter(object):
+    """Find checks that can possibly report violations in a source.
+
+    Most trigger patterns match a single word. They are looked up in the
+    set of words in the source, which is built in a single pass. Other
+    patterns are searched separately, unless all of their checks are
+    already known to be live.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        # Word - codes of the checks that it triggers.
+        self._words = {}
+        # Pattern - codes of the checks that it triggers.
+        patterns = collections.OrderedDict()
+        for code, rule in sorted(rules.items()):
+            triggers = rule.triggers
+            if callable(triggers):
+                triggers = triggers()
+            for pattern in triggers:
+                match = _word_trigger_re.match(pattern)
+                if match is not None:
+                    # re.escape() in Python 2 escapes underscores.
+                    word = match.group(1).replace('\\', '')
+                    self._words.setdefault(word, set()).add(code)
+                else:
+                    patterns.setdefault(pattern, set()).add(code)
+        self._regexes = [(re.compile(pattern), codes) for pattern, codes in patterns.items()]
+
+    def live_rules(self, source):
+        """Return the set of check codes whose triggers appear in *source*."""
+        found = set()
+        if self._words:
+            for word in set(_word_re.findall(source)).intersection(self._words):
+                found.update(self._words[word])
+        for regex, codes in self._regexes:
+            if not found.issuperset(codes) and regex.search(source):
+                found.update(codes)
+        return found
+
+
+# Subscriptions are (node type name, check method name) pairs. Check
+# methods are called before the children of the node are visited.
+# A check can only report violations if one of its trigger patterns
+# matches the source code. Patterns are regular expressions and callables
+# return the patterns of checks that use configurable tables.
+Rule = collections.namedtuple('Rule', ['subscriptions', 'triggers'])
+
+
+def _checks_handler(checks):
+    def handler(self, node):
+        for check in checks:
+            check(self, node)
+        self.generic_visit(node)
+    # Used by HolviVisitor.iter_violations() to run the checks without
+    # visiting the children.
+    handler.checks = checks
+    return handler
+
 
 class HolviVisitor(ast.NodeVisitor):
 
@@ -97,14 +928,181 @@ class HolviVisitor(ast.NodeVisitor):
         }
     }
 
-    def __init__(self, ignore_warnings=False):
+    rules = {
+        'HLVW301': Rule((('Call', 'check_unicode_call'),), (r'\bunicode\b',)),
+        'HLVE006': Rule((('Call', 'check_logging_call'),), (r'\blogger\b', r'\blogging\b')),
+        'HLVE007': Rule((('Call', 'check_logging_call'),), (r'\blogger\b', r'\blogging\b')),
+        'HLVE008': Rule((('Lambda', 'check_late_binding'),), (r'\blambda\b',)),
+        'HLVE009': Rule((('Call', 'check_logging_call'),), (r'\blogger\b', r'\blogging\b')),
+        'HLVE010': Rule((('Call', 'check_logging_call'),), (r'\blogger\b', r'\blogging\b')),
+        'HLVE012': Rule((('Lambda', 'check_late_binding'),), (r'\blambda\b',)),
+        'HLVE013': Rule(
+            (
+                ('Module', 'check_empty_docstring'),
+                ('ClassDef', 'check_empty_docstring'),
+                ('FunctionDef', 'check_empty_docstring'),
+            ),
+            # A string literal that only contains whitespace.
+            (r'(?:\'\'\'|"""|\'|")(?:\s|\\.)*?(?:\'\'\'|"""|\'|")',),
+        ),
+        'HLVE014': Rule(
+            (('Attribute', 'check_unittest_assertion'),),
+            lambda: _word_patterns(nonstandard_unittest_assertequal_asserts),
+        ),
+        'HLVE015': Rule(
+            (('Attribute', 'check_unittest_assertion'),),
+            lambda: _word_patterns(deprecated_unittest_assertions),
+        ),
+        'HLVE016': Rule((('Assert', 'check_assert'),), (r'\bassert\b',)),
+        'HLVE301': Rule((('Print', 'check_print'),), (r'\bprint\b',)),
+        'HLVE302': Rule((('Call', 'check_unicode_call'),), (r'\bunicode\b',)),
+        'HLVE303': Rule((('Call', 'check_str_call'),), (r'\bstr\b',)),
+        'HLVE309': Rule(
+            (('Import', 'check_python2_import'), ('ImportFrom', 'check_python2_import')),
+            lambda: _word_patterns(python2_modules_map),
+        ),
+        'HLVE310': Rule(
+            (('Attribute', 'check_unittest_assertion'),),
+            lambda: _word_patterns(python2_unittest_assertions),
+        ),
+        'HLVE311': Rule(
+            (('ImportFrom', 'check_implicit_relative_import'),),
+            lambda: _word_patterns(potential_implicit_relative_imports),
+        ),
+        'HLVE312': Rule((('Call', 'check_assert_in_content'),), (r'\bassertIn\b', r'\bassertNotIn\b')),
+        'HLVE313': Rule(
+            (
+                # Imports of whitelisted exceptions are needed by the check.
+                ('ImportFrom', 'collect_import_from'),
+                ('Attribute', 'check_exception_message'),
+            ),
+            (r'\.[\s\\]*message\b',),
+        ),
+        'HLVE314': Rule(
+            (('Call', 'check_python2_builtin_methods'),),
+            lambda: _word_patterns(python2_builtin_methods),
+        ),
+    }
+
+    def __init__(self, ignore_warnings=False, enabled_codes=None, relative_imports=None,
+                 message_exceptions=None):
         self.ignore_warnings = ignore_warnings
+        if enabled_codes is not None:
+            enabled_codes = frozenset(enabled_codes)
+        self.enabled_codes = enabled_codes
+        # Modules that HLVE311 reports when imported without a dot.
+        if relative_imports is None:
+            relative_imports = potential_implicit_relative_imports
+        self.relative_imports = relative_imports
+        # Exceptions that HLVE313 doesn't report. Relative module names
+        # start with dots.
+        if message_exceptions is None:
+            message_exceptions = known_message_exceptions
+        self.message_exceptions = message_exceptions
+        # List of Violation instances.
         self.violations = []
-        self.violation_codes = []
 
         self.node_stack = []
         self.import_from_nodes = []
-        self._inside_for_node = None
+
+        # Enclosing nodes of interest, innermost last. They are maintained
+        # in visit() so rules don't need to scan node_stack.
+        self.except_handlers = []
+        self.functions = []
+        self.classes = []
+        self.loops = []
+        # For loops and comprehensions, whose targets are bound late by
+        # lambdas defined inside them.
+        self.binding_loops = []
+        self._context_stacks = {}
+        for node_types, stacks in (
+            (_node_types('ExceptHandler'), (self.except_handlers,)),
+            (_node_types('FunctionDef', 'AsyncFunctionDef'), (self.functions,)),
+            (_node_types('ClassDef'), (self.classes,)),
+            (_node_types('For', 'AsyncFor'), (self.loops, self.binding_loops)),
+            (_node_types('While'), (self.loops,)),
+            (_comprehension_types, (self.binding_loops,)),
+        ):
+            for node_type in node_types:
+                self._context_stacks[node_type] = stacks
+
+        # Maps function nodes to the result of collect_string_literals().
+        self._string_literals = {}
+        # Maps nodes of binding_loops to the names bound by them.
+        self._loop_names = {}
+
+        self._dispatch = self.get_dispatch_table(enabled_codes)
+
+    @classmethod
+    def get_message(cls, code):
+        if code in cls.messages['warnings']:
+            return cls.messages['warnings'][code]
+        return cls.messages['errors'].get(code)
+
+    # Maps visitor classes and enabled codes to their node type -> handler
+    # tables.
+    _dispatch_tables = {}
+
+    @classmethod
+    def _get_check(cls, name):
+        return getattr(cls, name)
+
+    @classmethod
+    def get_checks(cls, enabled_codes=None):
+        """Return a mapping of node type names to check methods.
+
+        Only the checks of *enabled_codes* are included if it's not None.
+        """
+        checks = {}
+        for code, rule in sorted(cls.rules.items()):
+            if enabled_codes is not None and code not in enabled_codes:
+                continue
+            for node_type_name, check_name in rule.subscriptions:
+                node_checks = checks.setdefault(node_type_name, [])
+                if check_name not in node_checks:
+                    node_checks.append(check_name)
+        return dict(
+            (node_type_name, tuple(cls._get_check(name) for name in names))
+            for node_type_name, names in checks.items()
+        )
+
+    @classmethod
+    def _resolve_handler(cls, node_type, checks):
+        # None means that no rule is interested in this node type and the
+        # node's children will be visited by generic_visit().
+        name = 'visit_' + node_type.__name__
+        for klass in cls.__mro__:
+            if klass is ast.NodeVisitor:
+                # ast.NodeVisitor.visit_Constant() only dispatches to the
+                # deprecated visit_Str() etc. which we don't implement.
+                break
+            if name in vars(klass):
+                # visit_* methods of subclasses are still supported. Like
+                # in ast.NodeVisitor, they need to call generic_visit().
+                return cls._get_check(name)
+        node_checks = checks.get(node_type.__name__)
+        if not node_checks:
+            return None
+        return _checks_handler(node_checks)
+
+    @classmethod
+    def get_dispatch_table(cls, enabled_codes=None):
+        """Return a mapping of node types to handlers.
+
+        The table is built once per visitor class and set of enabled codes,
+        so disabled checks cost nothing during traversal.
+        """
+        if enabled_codes is not None:
+            enabled_codes = frozenset(enabled_codes)
+        key = (cls, enabled_codes)
+        table = cls._dispatch_tables.get(key)
+        if table is None:
+            checks = cls.get_checks(enabled_codes)
+            table = {}
+            for node_type in _ast_node_types():
+                table[node_type] = cls._resolve_handler(node_type, checks)
+            cls._dispatch_tables[key] = table
+        return table
 
     def _has_empty_docstring(self, node):
         try:
@@ -120,6 +1118,45 @@ class HolviVisitor(ast.NodeVisitor):
                 return True
             return False
 
+    def _get_string_literals(self, node):
+        try:
+            return self._string_literals[node]
+        except KeyError:
+            bindings = self._string_literals[node] = collect_string_literals(node.body)
+            return bindings
+
+    def _get_loop_names(self):
+        """Return the names that enclosing loops bind for the visited lambda.
+
+        Only for loops and comprehensions inside the function or lambda
+        around the visited lambda count. Loops whose iterable contains the
+        lambda don't bind its names either. The names of a loop are
+        computed once, when the first lambda inside it is checked.
+        """
+        names = set()
+        node_stack = self.node_stack
+        # The last node is the visited lambda.
+        for index in range(len(node_stack) - 2, -1, -1):
+            node = node_stack[index]
+            if isinstance(node, _function_types):
+                break
+            if not isinstance(node, _binding_loop_types):
+                continue
+            child = node_stack[index + 1]
+            if isinstance(node, _comprehension_types):
+                # The first iterable is evaluated outside the comprehension.
+                generator = node.generators[0]
+                if child is generator and node_stack[index + 2] is generator.iter:
+                    continue
+            elif child is node.iter:
+                continue
+            try:
+                names.update(self._loop_names[node])
+            except KeyError:
+                loop_names = self._loop_names[node] = _bound_names(node)
+                names.update(loop_names)
+        return names
+
     def _get_target_name(self, node):
         if isinstance(node.value, ast.Name):
             return '%s.content' % node.value.id
@@ -127,7 +1164,7 @@ class HolviVisitor(ast.NodeVisitor):
             return '%s.%s.content' % (node.value.value.id, node.value.attr)
         assert False, 'please report this to holvi/flake8-holvi'
 
-    def visit_FunctionDef(self, node):
+    def check_empty_docstring(self, node):
         if self._has_empty_docstring(node):
             if isinstance(node, ast.FunctionDef):
                 # TODO: @staticmethod is detected as function.
@@ -154,182 +1191,148 @@ class HolviVisitor(ast.NodeVisitor):
                 assert False, 'shouldn\'t happen'
             # The following node is also used by ast.get_docstring().
             self.report_error(node.body[0].value, 'HLVE013', args=(name,))
-        self.generic_visit(node)
-
-    visit_ClassDef = visit_Module = visit_FunctionDef
 
-    def visit_Print(self, node):
+    def check_print(self, node):
         self.report_error(node, 'HLVE301')
-        self.generic_visit(node)
 
-    def visit_Assert(self, node):
+    def check_assert(self, node):
         self.report_error(node, 'HLVE016')
-        self.generic_visit(node)
 
-    def visit_Call(self, node):
-        func = getattr(node, 'func', None)
-        func_name = getattr(func, 'id', None)
-        func_value = getattr(func, 'value', None)
+    def check_unicode_call(self, node):
         # unicode(...)
-        if func and func_name == 'unicode':
+        if getattr(node.func, 'id', None) == 'unicode':
             self.report_error(node, 'HLVE302')
             value = getattr(node.args[0], 's', None)
             # unicode('non-ascıı')
             if len(node.args) == 1 and isinstance(value, str):
                 self.report_warning(node, 'HLVW301')
 
+    def check_str_call(self, node):
         # str(...)
-        elif func and func_name == 'str':
+        if getattr(node.func, 'id', None) == 'str':
             self.report_error(node, 'HLVE303')
             # TODO: str(u"aaaı")
 
+    def check_logging_call(self, node):
         # logging.debug('%s' % 'a')
         # logger.error('%s' % 'a')
         # logging.debug('{}'.format('a'))
         # logger.warning('{}'.format('a'))
-        elif func and getattr(func_value, 'id', None) in ('logger', 'logging'):
-            logging_methods = ('debug', 'info', 'warning', 'error', 'critical', 'exception')
-            if getattr(func, 'attr', None) in logging_methods:
-                # %-format
-                if len(node.args) and isinstance(node.args[0], ast.BinOp):
-                    self.report_error(node, 'HLVE006', args=(func_value.id, func.attr))
-                # str.format()
-                elif (
-                    len(node.args) and isinstance(node.args[0], ast.Call)
-                        and getattr(node.args[0].func, 'attr', None) == 'format'
-                ):
-                    self.report_error(node, 'HLVE007', args=(func_value.id, func.attr))
-                # logging.debug('Foo: %s')
-                elif len(node.args) == 1 and isinstance(node.args[0], ast.Str):
-                    logging_statement = node.args[0].s
-                    if '%s' in logging_statement:
-                        self.report_error(node, 'HLVE009', args=('%s', func_value.id, func.attr))
-                    if '%d' in logging_statement:
-                        self.report_error(node, 'HLVE009', args=('%d', func_value.id, func.attr))
-
-                # logging.exception() is not inside try...except.
-                if func.attr == 'exception':
-                    if not any(isinstance(n, ast.ExceptHandler) for n in self.node_stack):
-                        self.report_error(node, 'HLVE010', args=(func_value.id,))
+        func = node.func
+        func_value = getattr(func, 'value', None)
+        if getattr(func_value, 'id', None) not in ('logger', 'logging'):
+            return
+        logging_methods = ('debug', 'info', 'warning', 'error', 'critical', 'exception')
+        if getattr(func, 'attr', None) in logging_methods:
+            # %-format
+            if len(node.args) and isinstance(node.args[0], ast.BinOp):
+                self.report_error(node, 'HLVE006', args=(func_value.id, func.attr))
+            # str.format()
+            elif (
+                len(node.args) and isinstance(node.args[0], ast.Call)
+                    and getattr(node.args[0].func, 'attr', None) == 'format'
+            ):
+                self.report_error(node, 'HLVE007', args=(func_value.id, func.attr))
+            # logging.debug('Foo: %s')
+            elif len(node.args) == 1 and isinstance(node.args[0], ast.Str):
+                logging_statement = node.args[0].s
+                if '%s' in logging_statement:
+                    self.report_error(node, 'HLVE009', args=('%s', func_value.id, func.attr))
+                if '%d' in logging_statement:
+                    self.report_error(node, 'HLVE009', args=('%d', func_value.id, func.attr))
+
+            # logging.exception() is not inside try...except.
+            if func.attr == 'exception':
+                if not self.except_handlers:
+                    self.report_error(node, 'HLVE010', args=(func_value.id,))
 
+    def check_assert_in_content(self, node):
         # self.assertIn(..., response.content)
-        elif func and getattr(func_value, 'id', None) == 'self':
-            method_name = getattr(func, 'attr', None)
-            # For assertIn, the first argument must be Str or Name.
-            if method_name in ('assertIn', 'assertNotIn'):
-                first = node.args[0]
-                second = node.args[1]
-                if isinstance(second, ast.Attribute):
-                    if second.attr == 'content':
-                        # self.assertIn(u'foo', response.content)
-                        if isinstance(first, ast.Str):
-                            if not isinstance(first.s, str):
-                                prefix = 'First argument of assertIn'
-                                target_name = self._get_target_name(second)
-                                self.report_error(first, 'HLVE312', args=(prefix, target_name))
-
-                        # self.assertIn(variable, response.content)
-                        elif isinstance(first, ast.Name):
-                            for n in reversed(self.node_stack[:-1]):
-                                if isinstance(n, ast.FunctionDef):
-                                    for stmt in n.body:
-                                        if (
-                                            isinstance(stmt, ast.Assign) and
-                                            isinstance(stmt.targets[0], ast.Name) and
-                                            isinstance(stmt.value, ast.Str) and
-                                            stmt.targets[0].id == first.id and
-                                            not isinstance(stmt.value.s, str)
-                                        ):
-                                            prefix = '%r of assertIn' % first.id
-                                            target_name = self._get_target_name(second)
-                                            self.report_error(first, 'HLVE312', args=(prefix, target_name))
-                                            break
-                                    break
+        func = node.func
+        if getattr(getattr(func, 'value', None), 'id', None) != 'self':
+            return
+        method_name = getattr(func, 'attr', None)
+        # For assertIn, the first argument must be Str or Name.
+        if method_name in ('assertIn', 'assertNotIn'):
+            first = node.args[0]
+            second = node.args[1]
+            if isinstance(second, ast.Attribute):
+                if second.attr == 'content':
+                    # self.assertIn(u'foo', response.content)
+                    if isinstance(first, ast.Str):
+                        if not isinstance(first.s, str):
+                            prefix = 'First argument of assertIn'
+                            target_name = self._get_target_name(second)
+                            self.report_error(first, 'HLVE312', args=(prefix, target_name))
 
-        # dict.iteritems() and its friends.
-        elif func and isinstance(func, ast.Attribute) and func.attr in python2_builtin_methods:
-            new_name = 'six.%s()' % func.attr
-            if isinstance(func.value, ast.Name) and func.value.id != 'six':
-                old_name = '%s.%s()' % (func.value.id, func.attr)
-                self.report_error(func, 'HLVE314', args=(old_name, new_name))
-            elif isinstance(func.value, ast.Attribute):
-                obj = func.value.value
-                if isinstance(obj, ast.Name):
-                    old_name = '%s.%s.%s()' % (obj.id, func.value.attr, func.attr)
-                elif isinstance(obj, ast.Call):
-                    if obj.args or obj.keywords:
-                        obj_args = '(...)'
-                    else:
-                        obj_args = '()'
-                    old_name = '%s%s.%s.%s()' % (obj.func.id, obj_args, func.value.attr, func.attr)
-                else:  # pragma: no cover
-                    assert False, 'uncovered case; please report to holvi/flake8-holvi'
-                self.report_error(func, 'HLVE314', args=(old_name, new_name))
+                    # self.assertIn(variable, response.content)
+                    elif isinstance(first, ast.Name) and self.functions:
+                        bindings = self._get_string_literals(self.functions[-1])
+                        values = bindings.get(first.id, ())
+                        if any(not isinstance(value, str) for value in values):
+                            prefix = '%r of assertIn' % first.id
+                            target_name = self._get_target_name(second)
+                            self.report_error(first, 'HLVE312', args=(prefix, target_name))
 
-        self.generic_visit(node)
+    def check_python2_builtin_methods(self, node):
+        # dict.iteritems() and its friends.
+        func = node.func
+        if not isinstance(func, ast.Attribute) or func.attr not in python2_builtin_methods:
+            return
+        # Methods of self and loggers aren't dict methods. The checks of
+        # 0.5.3 skipped them too because visit_Call() handled these names
+        # in earlier branches.
+        if getattr(func.value, 'id', None) in ('self', 'logger', 'logging'):
+            return
+        new_name = 'six.%s()' % func.attr
+        if isinstance(func.value, ast.Name) and func.value.id != 'six':
+            old_name = '%s.%s()' % (func.value.id, func.attr)
+            self.report_error(func, 'HLVE314', args=(old_name, new_name))
+        elif isinstance(func.value, ast.Attribute):
+            obj = func.value.value
+            if isinstance(obj, ast.Name):
+                old_name = '%s.%s.%s()' % (obj.id, func.value.attr, func.attr)
+            elif isinstance(obj, ast.Call):
+                if obj.args or obj.keywords:
+                    obj_args = '(...)'
+                else:
+                    obj_args = '()'
+                old_name = '%s%s.%s.%s()' % (obj.func.id, obj_args, func.value.attr, func.attr)
+            else:  # pragma: no cover
+                assert False, 'uncovered case; please report to holvi/flake8-holvi'
+            self.report_error(func, 'HLVE314', args=(old_name, new_name))
 
-    def visit_For(self, node):
-        self._inside_for_node = node
-        self.generic_visit(node)
-        self._inside_for_node = None
-
-    def visit_Lambda(self, node):
-        if self._inside_for_node is not None:
-            if isinstance(node.body, ast.Call) and isinstance(node.body.func, ast.Attribute):
-                # Get the name of control variable from 'for <control_variable> in ...'.
-                if 'id' not in self._inside_for_node.target._fields:  # pragma: no cover
-                    # TODO: We don't support 'for i, j in ...' yet.
-                    return
-                control_variable = self._inside_for_node.target.id
-                # Default arguments passed to lambda: 'lambda foo=foo: ...'
-                defaults = node.args.defaults
-                for arg in node.body.args:
-                    # Check if arg is ast.List, ast.Tuple, or ast.Set.
-                    if 'elts' in arg._fields:
-                        elts = arg.elts
-                        for e in elts:
-                            # Look for ast.Attribute nodes.
-                            if 'value' in e._fields and e.value.id == control_variable:
-                                if len(defaults) == 0:
-                                    # control variable isn't passed to lambda.
-                                    self.report_error(node, 'HLVE008', args=(control_variable,))
-                                elif len(defaults) > 0:
-                                    # There is a default argument passed, let's check it's used at all.
-                                    found = False
-                                    for d in defaults:
-                                        # TODO: check Attribute node for lambda foo=bar.baz: ...
-                                        # We only look for Name nodes now.
-                                        if 'id' in d._fields and d.id == control_variable:
-                                            found = True
-                                            break
-                                    if not found:
-                                        self.report_error(node, 'HLVE012', args=(control_variable,))
-                            # Look for ast.Name nodes.
-                            elif 'id' in e._fields and e.id == control_variable:
-                                if len(defaults) == 0:
-                                    # Control variable isn't passed to lambda.
-                                    self.report_error(node, 'HLVE008', args=(control_variable,))
-                                elif len(defaults) > 1:  # pragma: no cover
-                                    assert False, 'implement this for ast.Tuple etc.'
-                    # Check if arg is ast.Attribute.
-                    elif 'value' in arg._fields:
-                        if arg.value.id == control_variable:
-                            if len(defaults) == 0:
-                                # Control variable isn't passed to lambda.
-                                self.report_error(node, 'HLVE008', args=(control_variable,))
-                            elif len(defaults) > 1:  # pragma: no cover
-                                assert False, 'implement this for ast.Attribute'
-                    # Check if arg is ast.Name.
-                    elif 'id' in arg._fields:
-                        if arg.id == control_variable:
-                            if len(defaults) == 0:
-                                # Control variable isn't passed to lambda.
-                                self.report_error(node, 'HLVE008', args=(control_variable,))
-                            elif len(defaults) > 1:  # pragma: no cover
-                                assert False, 'implement this for ast.Name'
-        self.generic_visit(node)
+    def check_late_binding(self, node):
+        if not self.binding_loops or not isinstance(node.body, ast.Call):
+            return
+        call = node.body
+        if not isinstance(call.func, ast.Attribute):
+            return
+        loop_names = self._get_loop_names()
+        # Names that are passed to the call but aren't parameters of the
+        # lambda are looked up when the lambda is called.
+        values = list(call.args) + [keyword.value for keyword in call.keywords]
+        for name in ('starargs', 'kwargs'):
+            # Python 2 and 3.4.
+            if getattr(call, name, None) is not None:
+                values.append(getattr(call, name))
+        used = []
+        # Targets of comprehensions inside the call.
+        bound = set()
+        _collect_names(values, used, bound)
+        late_names = set(used).intersection(loop_names)
+        if not late_names:
+            return
+        late_names.difference_update(_argument_names(node.args), bound)
+        has_defaults = bool(node.args.defaults) or any(getattr(node.args, 'kw_defaults', ()))
+        for name in used:
+            if name in late_names:
+                if has_defaults:
+                    self.report_error(node, 'HLVE012', args=(name,))
+                else:
+                    self.report_error(node, 'HLVE008', args=(name,))
 
-    def visit_Attribute(self, node):
+    def check_unittest_assertion(self, node):
         method_name = node.attr
         if (
             isinstance(node.value, ast.Name) and
@@ -349,61 +1352,218 @@ class HolviVisitor(ast.NodeVisitor):
                     'HLVE015',
                     args=(method_name, deprecated_unittest_assertions[method_name]),
                 )
-        elif isinstance(node.value, ast.Name) and node.attr == 'message':
-            whitelist_exceptions = [
-                # Django's ValidationError has a message attribute.
-                ('django.core.exceptions', 'ValidationError'),
-            ]
-            for n in reversed(self.node_stack[:-1]):
+
+    def check_exception_message(self, node):
+        # Like in 0.5.3, where visit_Attribute() handled self in an earlier
+        # branch, self.message isn't reported.
+        if (
+            isinstance(node.value, ast.Name) and
+            node.value.id != 'self' and
+            node.attr == 'message'
+        ):
+            for n in reversed(self.except_handlers):
                 # n.name.id is present in Python 2 whereas n.name is str
                 # in Python 3.
-                if isinstance(n, ast.ExceptHandler) and getattr(n.name, 'id', n.name) == node.value.id:
-                    found = False
-                    for exc in whitelist_exceptions:
-                        # We can ignore cases such as Exception.Foo because we only
-                        # look for ValidationError in the whitelist.
-                        if 'id' in n.type._fields and exc[1] == n.type.id and exc in self.import_from_nodes:
-                            found = True
-                            break
-                    if not found:
-                        self.report_error(node, 'HLVE313', args=(n.name.id,))
+                name = getattr(n.name, 'id', n.name)
+                if name == node.value.id:
+                    # We can ignore cases such as Exception.Foo because
+                    # whitelisted exceptions are looked up by imported names.
+                    if not (
+                        isinstance(n.type, ast.Name) and
+                        any(
+                            local_name == n.type.id and (module, name) in self.message_exceptions
+                            for module, name, local_name in self.import_from_nodes
+                        )
+                    ):
+                        self.report_error(node, 'HLVE313', args=(name,))
                     break
-        self.generic_visit(node)
 
-    def visit_Import(self, node):
-        for name in node.names:
-            mod_name = name.name
+    def check_python2_import(self, node):
+        if isinstance(node, ast.ImportFrom):
+            mod_names = [node.module]
+        else:
+            mod_names = [name.name for name in node.names]
+        for mod_name in mod_names:
             if mod_name in python2_modules_map:
                 self.report_error(
                     node,
                     'HLVE309',
                     args=(mod_name, python2_modules_map[mod_name]),
                 )
-        self.generic_visit(node)
 
-    def visit_ImportFrom(self, node):
-        self.import_from_nodes.append((node.module, node.names[0].name))
+    def check_implicit_relative_import(self, node):
         mod_name = node.module
-        if mod_name in python2_modules_map:
-            self.report_error(
-                node,
-                'HLVE309',
-                args=(mod_name, python2_modules_map[mod_name]),
-            )
-        # Ignore explicit relative imports.
-        elif node.level == 0 and mod_name in potential_implicit_relative_imports:
+        # Ignore explicit relative imports. Python 2-only modules are
+        # reported as HLVE309.
+        if (
+            node.level == 0 and
+            mod_name in self.relative_imports and
+            mod_name not in python2_modules_map
+        ):
             self.report_error(
                 node,
                 'HLVE311',
                 args=(mod_name, '.%s' % mod_name),
             )
-        self.generic_visit(node)
+
+    def collect_import_from(self, node):
+        self.import_from_nodes.extend(_imported_names(node))
+
+    def visit_changed(self, tree, changed_lines):
+        """Visit the top-level statements of *tree* that overlap *changed_lines*.
+
+        *changed_lines* is a sorted list of inclusive (start, end) tuples as
+        returned by parse_diff(). Imports in the skipped statements are still
+        recorded because other rules depend on them.
+        """
+        body = tree.body
+        selected = []
+        for index, (start, end) in enumerate(_statement_ranges(body, sys.maxsize)):
+            stmt = body[index]
+            # Keep the docstring so that ast.get_docstring() doesn't pick up
+            # another string.
+            if (index == 0 and _is_docstring(stmt)) or lines_overlap(changed_lines, start, end):
+                selected.append(stmt)
+            elif isinstance(stmt, ast.ImportFrom):
+                self.import_from_nodes.extend(_imported_names(stmt))
+        module = copy.copy(tree)
+        module.body = selected
+        self.visit(module)
+
+    def visit_incremental(self, tree, fingerprints, previous):
+        """Visit *tree* but reuse the results of unchanged top-level statements.
+
+        *fingerprints* identifies the source of each statement in tree.body
+        and *previous* is the return value of a visit of an earlier version
+        of the module. A statement is skipped if its fingerprint and the
+        imports recorded before it are unchanged. Its violations are then
+        moved to the new location of the statement.
+        """
+        body = tree.body
+        module = copy.copy(tree)
+        # Module checks need the docstring.
+        module.body = body[:1] if body and _is_docstring(body[0]) else []
+        self.visit(module)
+        statements = {}
+        self.node_stack.append(tree)
+        for index in range(len(module.body), len(body)):
+            stmt = body[index]
+            start = _statement_start(stmt)
+            # Imports are the only module-wide facts that checks depend on.
+            key = (fingerprints[index], tuple(self.import_from_nodes))
+            cached = previous.get(key)
+            if cached is None:
+                facts_start = len(self.import_from_nodes)
+                violations_start = len(self.violations)
+                self.visit(stmt)
+                facts = self.import_from_nodes[facts_start:]
+                violations = self.violations[violations_start:]
+            else:
+                old_start, facts, violations = cached
+                shift = start - old_start
+                if shift:
+                    violations = [
+                        Violation(v.lineno + shift, v.col_offset, v.code, v.template, v.args)
+                        for v in violations
+                    ]
+                self.import_from_nodes.extend(facts)
+                self.violations.extend(violations)
+            statements[key] = (start, facts, violations)
+        self.node_stack.pop()
+        return statements
+
+    def iter_violations(self, tree):
+        """Visit *tree* and yield violations as soon as they are found.
+
+        Statements are visited one at a time and the violations found in
+        a statement are yielded before the next one is visited. They are
+        yielded in the same order as visit() reports them but they aren't
+        kept in self.violations. Stopping the iteration early skips the
+        rest of the tree.
+        """
+        return self._iter_node(tree)
+
+    def _iter_node(self, node):
+        node_type = node.__class__
+        try:
+            handler = self._dispatch[node_type]
+        except KeyError:
+            handler = self._dispatch[node_type] = self._resolve_handler(
+                node_type, self.get_checks(self.enabled_codes),
+            )
+        checks = () if handler is None else getattr(handler, 'checks', None)
+        if checks is None:
+            # visit_* methods of subclasses visit the children themselves.
+            self.visit(node)
+        else:
+            self.node_stack.append(node)
+            context_stacks = self._context_stacks.get(node_type)
+            if context_stacks is not None:
+                for stack in context_stacks:
+                    stack.append(node)
+            for check in checks:
+                check(self, node)
+            visit = self.visit
+            for field in node._fields:
+                value = getattr(node, field, None)
+                if isinstance(value, list):
+                    for item in value:
+                        if isinstance(item, _block_types):
+                            for violation in self._iter_node(item):
+                                yield violation
+                        elif isinstance(item, ast.AST):
+                            visit(item)
+                            if self.violations:
+                                violations = self.violations
+                                self.violations = []
+                                for violation in violations:
+                                    yield violation
+                elif isinstance(value, ast.AST):
+                    visit(value)
+            if context_stacks is not None:
+                for stack in context_stacks:
+                    stack.pop()
+            self.node_stack.pop()
+        if self.violations:
+            violations = self.violations
+            self.violations = []
+            for violation in violations:
+                yield violation
 
     def visit(self, node):
         self.node_stack.append(node)
-        super(HolviVisitor, self).visit(node)
+        node_type = node.__class__
+        context_stacks = self._context_stacks.get(node_type)
+        if context_stacks is not None:
+            for stack in context_stacks:
+                stack.append(node)
+        try:
+            handler = self._dispatch[node_type]
+        except KeyError:
+            # Node types that aren't exposed in the ast module.
+            handler = self._dispatch[node_type] = self._resolve_handler(
+                node_type, self.get_checks(self.enabled_codes),
+            )
+        if handler is None:
+            self.generic_visit(node)
+        else:
+            handler(self, node)
+        if context_stacks is not None:
+            for stack in context_stacks:
+                stack.pop()
         self.node_stack.pop()
 
+    def generic_visit(self, node):
+        visit = self.visit
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        visit(item)
+            elif isinstance(value, ast.AST):
+                visit(value)
+
     def report_error(self, node, code, args=None):
         message = self.messages['errors'].get(code)
         self._report_message(node, code, message, args)
@@ -423,29 +1583,284 @@ class HolviVisitor(ast.NodeVisitor):
         return message
 
     def _report_message(self, node, code, message, args=None):
-        message = self._format_message(code, message, args)
-        lineno = 1 if isinstance(node, ast.Module) else node.lineno
-        col_offset = 1 if isinstance(node, ast.Module) else node.col_offset
-        self.violations.append((
-            lineno,
-            col_offset,
-            message,
-            type(self),
-        ))
-        self.violation_codes.append(code)
+        # A check may report more than one code.
+        if self.enabled_codes is not None and code not in self.enabled_codes:
+            return
+        if isinstance(node, ast.Module):
+            self.violations.append(Violation(1, 1, code, message, args))
+        else:
+            self.violations.append(Violation(node.lineno, node.col_offset, code, message, args))
 
+    @property
+    def violation_codes(self):
+        return [violation.code for violation in self.violations]
 
-class HolviChecker(object):
+
+class Violation(object):
+    """A violation found by HolviVisitor.
+
+    The message is only formatted when it's needed, since many violations
+    are thrown away because of noqa comments.
+    """
+
+    __slots__ = ('lineno', 'col_offset', 'code', 'template', 'args')
+
+    def __init__(self, lineno, col_offset, code, template, args=None):
+        self.lineno = lineno
+        self.col_offset = col_offset
+        self.code = code
+        self.template = template
+        self.args = args
+
+    @property
+    def message(self):
+        return HolviVisitor._format_message(self.code, self.template, self.args)
+
+    def __repr__(self):
+        return '<Violation %s at %d:%d>' % (self.code, self.lineno, self.col_offset)
+
+
+# Default value of flake8's --select option. Codes of plugins are reported
+# unless --select is changed.
+_flake8_default_select = frozenset(['E', 'F', 'W', 'C90'])
+
+
+def _option_codes(options, name):
+    value = getattr(options, name, None)
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = value.split(',')
+    return tuple(code.strip() for code in value if code.strip())
+
+
+def _longest_prefix(code, prefixes):
+    return max([len(prefix) for prefix in prefixes if code.startswith(prefix)] or [-1])
+
+
+# Prefixes of the codes that are never reported for each
+# --holvi-target-version. The Python 3 migration checks have nothing left to
+# find in code that only runs on Python 3.
+target_version_excludes = {
+    'py2': (),
+    'py3': ('HLVE3', 'HLVW3'),
+}
+
+
+def get_enabled_codes(options, codes):
+    """Return the subset of *codes* that flake8 may report with *options*.
+
+    This follows flake8's --select, --ignore, --extend-select,
+    --extend-ignore and --enable-extensions options. When in doubt, a
+    code is kept enabled because flake8 filters the results anyway.
+    """
+    select = _option_codes(options, 'select')
+    explicit_select = bool(select) and not set(select) <= _flake8_default_select
+    select += _option_codes(options, 'extend_select') + _option_codes(options, 'enable_extensions')
+    ignore = _option_codes(options, 'ignore') + _option_codes(options, 'extend_ignore')
+    enabled = set()
+    for code in codes:
+        selected = _longest_prefix(code, select)
+        if explicit_select and selected == -1:
+            continue
+        # The more specific option wins.
+        if _longest_prefix(code, ignore) > selected:
+            continue
+        enabled.add(code)
+    return enabled
+
+
+# time.perf_counter() doesn't exist in Python 2.
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+def _timed_check(name, check):
+    def timed_check(self, node):
+        nested_time = self._nested_time
+        nested_time.append(0.0)
+        start = _timer()
+        try:
+            check(self, node)
+        finally:
+            elapsed = _timer() - start
+            own_time = elapsed - nested_time.pop()
+            if nested_time:
+                nested_time[-1] += elapsed
+            record = self.check_stats.get(name)
+            if record is None:
+                record = self.check_stats[name] = [0, 0.0]
+            record[0] += 1
+            record[1] += own_time
+    return timed_check
+
+
+class StatsVisitor(HolviVisitor):
+    """HolviVisitor that records timings and node counts.
+
+    The time of each check excludes the time spent in checks of nested
+    nodes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(StatsVisitor, self).__init__(*args, **kwargs)
+        # Check name - [calls, seconds].
+        self.check_stats = {}
+        self.node_counts = {}
+        self._nested_time = []
+
+    @classmethod
+    def _get_check(cls, name):
+        return _timed_check(name, super(StatsVisitor, cls)._get_check(name))
+
+    def visit(self, node):
+        name = node.__class__.__name__
+        self.node_counts[name] = self.node_counts.get(name, 0) + 1
+        super(StatsVisitor, self).visit(node)
+
+
+# Parts directory of the StatsRecorder of the current run as
+# '<pid>:<key>:<path>'. Child processes inherit it.
+STATS_ENV = 'HOLVI_STATS'
+
+
+class StatsRecorder(object):
+    """Collect per-file statistics and merge them into a JSON report.
+
+    Every process appends its records to its own file in a temporary
+    directory next to *path*, so flake8 workers don't need to talk to
+    each other. Each run gets its own directory. The process that created
+    the recorder merges the files when it exits. Worker processes that
+    parse the options again find the directory through the HOLVI_STATS
+    environment variable like with get_project_index().
+    """
+
+    def __init__(self, path):
+        import tempfile
+
+        self.path = path
+        key = source_digest(os.path.abspath(path))
+        parent, _, directory = os.environ.get(STATS_ENV, '').partition(':%s:' % key)
+        if parent and parent != str(os.getpid()) and os.path.isdir(directory):
+            # A worker process of the run.
+            self.parts_directory = directory
+            self._pid = None
+            return
+        self.parts_directory = tempfile.mkdtemp(
+            prefix=os.path.basename(path) + '.parts-', dir=os.path.dirname(os.path.abspath(path)),
+        )
+        self._pid = os.getpid()
+        atexit.register(self._write_at_exit)
+        os.environ[STATS_ENV] = '%d:%s:%s' % (self._pid, key, self.parts_directory)
+
+    def record(self, filename, parse_time=0.0, walk_time=0.0, visitor=None, cached=False):
+        import json
+
+        record = {
+            'filename': filename,
+            'parse': parse_time,
+            'walk': walk_time,
+            'cached': cached,
+        }
+        if visitor is not None:
+            record['checks'] = visitor.check_stats
+            record['nodes'] = visitor.node_counts
+            violations = {}
+            for code in visitor.violation_codes:
+                violations[code] = violations.get(code, 0) + 1
+            record['violations'] = violations
+        part = os.path.join(self.parts_directory, '%d.jsonl' % os.getpid())
+        with open(part, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def merge(self):
+        import json
+
+        report = {
+            'files': {},
+            'checks': {},
+            'nodes': {},
+            'violations': {},
+            'totals': {'files': 0, 'cached': 0, 'parse': 0.0, 'walk': 0.0},
+        }
+        totals = report['totals']
+        for name in sorted(os.listdir(self.parts_directory)):
+            with open(os.path.join(self.parts_directory, name)) as f:
+                for line in f:
+                    record = json.loads(line)
+                    report['files'][record['filename']] = {
+                        'parse': record['parse'],
+                        'walk': record['walk'],
+                        'cached': record['cached'],
+                    }
+                    totals['files'] += 1
+                    totals['cached'] += int(record['cached'])
+                    totals['parse'] += record['parse']
+                    totals['walk'] += record['walk']
+                    for check, (calls, seconds) in record.get('checks', {}).items():
+                        stats = report['checks'].setdefault(check, {'calls': 0, 'time': 0.0})
+                        stats['calls'] += calls
+                        stats['time'] += seconds
+                    for key in ('nodes', 'violations'):
+                        for name, count in record.get(key, {}).items():
+                            report[key][name] = report[key].get(name, 0) + count
+        return report
+
+    def write(self):
+        import json
+
+        report = self.merge()
+        with open(self.path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        for name in os.listdir(self.parts_directory):
+            os.remove(os.path.join(self.parts_directory, name))
+        os.rmdir(self.parts_directory)
+
+    def _write_at_exit(self):
+        # Forked worker processes inherit atexit handlers.
+        if os.getpid() == self._pid and os.path.isdir(self.parts_directory):
+            self.write()
+
+
+class HolviChecker(object):
     name = 'flake8-holvi'
     version = __version__
 
+    # Default settings. They are overridden by parse_options().
+    ignore_warnings = False
+    # ResultCache instance if --holvi-cache-dir is passed.
+    cache = None
+    # Mapping of absolute paths to changed line ranges if --holvi-diff is
+    # passed.
+    changed_lines = None
+    # StatsRecorder instance if --holvi-stats is passed.
+    stats = None
+    # SourcePrefilter instance. Built on first use by get_prefilter().
+    prefilter = None
+    # Codes that flake8 may report or None if all of them are enabled.
+    enabled_codes = None
+    # Modules reported by HLVE311 and the names added with
+    # --holvi-relative-imports.
+    relative_imports = frozenset(potential_implicit_relative_imports)
+    extra_relative_imports = frozenset()
+    # ModuleIndex instance if --holvi-discover-relative-imports is passed.
+    # It's the project index if --holvi-project-index is passed too.
+    module_index = None
+    # ProjectIndex instance if --holvi-project-index is passed.
+    project_index = None
+    # Maximum number of violations reported per file or None.
+    max_violations = None
+
     def __init__(self, tree, filename, lines):
         self.tree = tree
         self.filename = filename
         self.lines = lines
-
-        # Default settings.
-        self.ignore_warnings = False
+        # Set to True by run() if the results were read from the cache.
+        self.cached = False
+        # If True, only the top-level statements that changed since the
+        # check that returned *statements* are visited. See
+        # HolviVisitor.visit_incremental().
+        self.incremental = False
+        self.statements = None
 
     @classmethod
     def add_options(cls, parser):
@@ -456,25 +1871,1343 @@ class HolviChecker(object):
             default=False,
             help='Do not report checks added as warnings.'
         )
+        parser.add_option(
+            '--holvi-cache-dir',
+            parse_from_config=True,
+            default=None,
+            help='Cache flake8-holvi results of unchanged files in this directory.'
+        )
+        parser.add_option(
+            '--holvi-cache-size',
+            type='int',
+            parse_from_config=True,
+            default=10000,
+            help='Maximum number of files kept in the flake8-holvi cache. '
+                 '(Default: %default)'
+        )
+        parser.add_option(
+            '--holvi-diff',
+            default=None,
+            metavar='REVISION_RANGE',
+            help='Only check lines changed in the given git revision range, '
+                 'e.g. origin/master...HEAD.'
+        )
+        parser.add_option(
+            '--holvi-stats',
+            default=None,
+            metavar='PATH',
+            help='Write timings and counters of flake8-holvi checks to PATH as JSON.'
+        )
+        parser.add_option(
+            '--holvi-relative-imports',
+            parse_from_config=True,
+            comma_separated_list=True,
+            default='',
+            help='Comma-separated list of additional module names to report '
+                 'as implicit relative imports (HLVE311).'
+        )
+        parser.add_option(
+            '--holvi-discover-relative-imports',
+            action='store_true',
+            parse_from_config=True,
+            default=False,
+            help='Report imports of modules found in the package of the checked '
+                 'file as implicit relative imports (HLVE311) instead of the '
+                 'built-in list of module names.'
+        )
+        parser.add_option(
+            '--holvi-project-index',
+            action='store_true',
+            parse_from_config=True,
+            default=False,
+            help='Index the modules and exception classes of the checked paths '
+                 'once and share the index with all worker processes. Used by '
+                 'HLVE313 and --holvi-discover-relative-imports.'
+        )
+        parser.add_option(
+            '--holvi-target-version',
+            parse_from_config=True,
+            default='py2',
+            choices=sorted(target_version_excludes),
+            help='Python version that the checked code targets. py3 turns off '
+                 'the Python 3 migration checks (HLVE3xx and HLVW3xx). '
+                 '(Default: %default)'
+        )
+        parser.add_option(
+            '--holvi-max-violations',
+            type='int',
+            parse_from_config=True,
+            default=0,
+            help='Stop checking a file after reporting this many violations. '
+                 '0 means no limit. (Default: %default)'
+        )
 
     @classmethod
     def parse_options(cls, options):
-        cls.ignore_warnings = options.ignore_warnings
+        # Missing options get their default values so that API users can
+        # pass only the options they need.
+        cls.ignore_warnings = getattr(options, 'ignore_warnings', False)
+        cache_dir = getattr(options, 'holvi_cache_dir', None)
+        if cache_dir:
+            cls.cache = ResultCache(cache_dir, getattr(options, 'holvi_cache_size', 10000))
+        else:
+            cls.cache = None
+        revision_range = getattr(options, 'holvi_diff', None)
+        if revision_range:
+            cls.changed_lines = get_changed_lines(revision_range)
+        else:
+            cls.changed_lines = None
+        stats_path = getattr(options, 'holvi_stats', None)
+        if stats_path:
+            cls.stats = StatsRecorder(stats_path)
+        else:
+            cls.stats = None
+        enabled_codes = get_enabled_codes(options, HolviVisitor.rules)
+        if cls.ignore_warnings:
+            enabled_codes = set(code for code in enabled_codes if not code.startswith('HLVW'))
+        # Checks of the excluded codes aren't even added to the visitor.
+        excluded = target_version_excludes[getattr(options, 'holvi_target_version', 'py2')]
+        enabled_codes = set(code for code in enabled_codes if not code.startswith(excluded))
+        if len(enabled_codes) == len(HolviVisitor.rules):
+            cls.enabled_codes = None
+        else:
+            cls.enabled_codes = frozenset(enabled_codes)
+        cls.extra_relative_imports = frozenset(
+            _option_codes(options, 'holvi_relative_imports')
+        )
+        cls.relative_imports = (
+            frozenset(potential_implicit_relative_imports) | cls.extra_relative_imports
+        )
+        if getattr(options, 'holvi_project_index', False):
+            paths = getattr(options, 'filenames', None) or getattr(options, 'paths', None)
+            exclude = getattr(options, 'exclude', None)
+            if exclude is not None and not isinstance(exclude, (list, tuple)):
+                exclude = [pattern.strip() for pattern in exclude.split(',') if pattern.strip()]
+            cls.project_index = get_project_index(paths or ['.'], exclude)
+        else:
+            cls.project_index = None
+        if getattr(options, 'holvi_discover_relative_imports', False):
+            cls.module_index = cls.project_index or ModuleIndex()
+        else:
+            cls.module_index = None
+        cls.max_violations = getattr(options, 'holvi_max_violations', 0) or None
+        cls.prefilter = None
+
+    @classmethod
+    def get_prefilter(cls):
+        if cls.prefilter is None:
+            rules = HolviVisitor.rules
+            if cls.enabled_codes is not None:
+                rules = dict(
+                    (code, rule) for code, rule in rules.items() if code in cls.enabled_codes
+                )
+            if 'HLVE311' in rules:
+                if cls.module_index is not None:
+                    # The modules depend on the location of the file.
+                    triggers = (r'\bimport\b',)
+                else:
+                    triggers = _word_patterns(cls.relative_imports)
+                rules = dict(rules)
+                rules['HLVE311'] = rules['HLVE311']._replace(triggers=triggers)
+            cls.prefilter = SourcePrefilter(rules)
+        return cls.prefilter
 
     def load_file(self):
+        import pycodestyle
+
         if self.filename in ('stdin', '-', None):
             self.filename = 'stdin'
             self.lines = pycodestyle.stdin_get_value().splitlines(True)
         else:
             self.lines = pycodestyle.readlines(self.filename)
 
+    def get_relative_imports(self):
+        """Return the modules that HLVE311 reports in this file."""
+        if self.module_index is None or self.filename in ('stdin', '-', None):
+            return self.relative_imports
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        return self.module_index.get_modules(directory) | self.extra_relative_imports
+
+    def get_message_exceptions(self):
+        """Return the exceptions that HLVE313 doesn't report in this file."""
+        if self.project_index is None or self.filename in ('stdin', '-', None):
+            return known_message_exceptions
+        return self.project_index.get_message_exceptions(self.filename)
+
+    def get_cache_settings(self):
+        """Return everything besides the source that affects the results."""
+        return {
+            'version': __version__,
+            'ignore_warnings': self.ignore_warnings,
+            'enabled_codes': None if self.enabled_codes is None else sorted(self.enabled_codes),
+            'python2_modules_map': python2_modules_map,
+            'python2_unittest_assertions': python2_unittest_assertions,
+            'nonstandard_unittest_assertequal_asserts': nonstandard_unittest_assertequal_asserts,
+            'deprecated_unittest_assertions': deprecated_unittest_assertions,
+            'potential_implicit_relative_imports': sorted(self.get_relative_imports()),
+            'python2_builtin_methods': sorted(python2_builtin_methods),
+            'message_exceptions': sorted(known_message_exceptions),
+            'project_index': self.get_project_index_settings(),
+        }
+
+    def get_project_index_settings(self):
+        """Return the parts of the project index that can affect this file.
+
+        A class can only be imported by a file that contains its name, so
+        changes to other exceptions in the project don't invalidate the
+        cached results of this file.
+        """
+        if self.project_index is None or self.filename in ('stdin', '-', None):
+            return None
+        classes = self.project_index.get_message_exception_classes()
+        words = set(_word_re.findall(''.join(self.lines))).intersection(classes)
+        return {
+            'package': self.project_index.get_package(self.filename),
+            'message_exceptions': sorted(
+                [module, name] for name in words for module in classes[name]
+            ),
+        }
+
     def run(self):
-        if not self.tree and not self.lines:
+        changed_lines = None
+        if self.changed_lines is not None:
+            if self.filename in ('stdin', '-', None):
+                return
+            changed_lines = self.changed_lines.get(os.path.abspath(self.filename))
+            if not changed_lines:
+                return
+        if self.lines is None:
             self.load_file()
-        self.tree = ast.parse(''.join(self.lines))
-        visitor = HolviVisitor(self.ignore_warnings)
-        visitor.visit(self.tree)
-        for lineno, col_offset, message, rtype in visitor.violations:
-            if pycodestyle.noqa(self.lines[lineno - 1]):
+        if self.cache is None:
+            violations = self._check(changed_lines)
+        else:
+            violations = self._check_cached(changed_lines)
+        count = 0
+        for violation in violations:
+            if changed_lines is None or lines_overlap(changed_lines, violation[0], violation[0]):
+                yield violation
+                count += 1
+                if count == self.max_violations:
+                    return
+
+    def _check_cached(self, changed_lines):
+        key = self.cache.make_key(''.join(self.lines), self.get_cache_settings())
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cached = True
+            if self.stats is not None:
+                self.stats.record(self.filename, cached=True)
+            return [
+                (lineno, col_offset, message, HolviVisitor)
+                for lineno, col_offset, message in cached
+            ]
+        violations = list(self._check(changed_lines))
+        # Don't store partial results.
+        if changed_lines is None:
+            self.cache.set(key, [v[:3] for v in violations])
+        return violations
+
+    def _check(self, changed_lines=None):
+        source = ''.join(self.lines)
+        codes = self.get_prefilter().live_rules(source)
+        if self.stats is not None:
+            return self._check_with_stats(source, codes, changed_lines)
+        if not codes:
+            # None of the checks can report a violation.
+            return iter(())
+        if self.tree is None:
+            # Only parse the module ourselves when flake8 didn't give us
+            # a tree.
+            self.tree = parse_source(source)
+        visitor = HolviVisitor(
+            self.ignore_warnings, codes, self.get_relative_imports(),
+            self.get_message_exceptions(),
+        )
+        if self.incremental and changed_lines is None:
+            self._visit_incremental(visitor, codes)
+        elif changed_lines is None:
+            # Violations are reported while the tree is walked, so callers
+            # that stop early don't pay for the rest of the file.
+            return self._filter_noqa(visitor, visitor.iter_violations(self.tree))
+        else:
+            self._visit(visitor, changed_lines)
+        return self._filter_noqa(visitor)
+
+    def _check_with_stats(self, source, codes, changed_lines):
+        if not codes:
+            self.stats.record(self.filename)
+            return iter(())
+        parse_time = 0.0
+        if self.tree is None:
+            start = _timer()
+            self.tree = parse_source(source)
+            parse_time = _timer() - start
+        visitor = StatsVisitor(
+            self.ignore_warnings, codes, self.get_relative_imports(),
+            self.get_message_exceptions(),
+        )
+        start = _timer()
+        self._visit(visitor, changed_lines)
+        walk_time = _timer() - start
+        self.stats.record(self.filename, parse_time, walk_time, visitor)
+        return self._filter_noqa(visitor)
+
+    def _visit(self, visitor, changed_lines):
+        if changed_lines is None:
+            visitor.visit(self.tree)
+        else:
+            visitor.visit_changed(self.tree, changed_lines)
+
+    def _visit_incremental(self, visitor, codes):
+        previous = {}
+        # Results of other checks can't be reused.
+        if self.statements is not None and self.statements[0] == codes:
+            previous = self.statements[1]
+        fingerprints = [
+            source_digest(''.join(self.lines[start - 1:end]))
+            for start, end in _statement_ranges(self.tree.body, len(self.lines))
+        ]
+        self.statements = (codes, visitor.visit_incremental(self.tree, fingerprints, previous))
+
+    def _filter_noqa(self, visitor, violations=None):
+        if violations is None:
+            violations = visitor.violations
+        rtype = type(visitor)
+        for violation in filter_noqa(self.lines, violations):
+            yield violation.lineno, violation.col_offset, violation.message, rtype
+
+
+_noqa_re = re.compile(
+    r'#\s*noqa(?::[\s]?(?P<codes>([A-Z]+[0-9]+(?:[,\s]+)?)+))?', re.I,
+)
+_file_noqa_re = re.compile(r'#\s*flake8[:=]\s*noqa(?P<codes>:\s?\S.*)?$', re.I)
+
+
+def _next_line(lines):
+    # The readline callable of tokenize must return '' at the end.
+    lines = iter(lines)
+    return lambda: next(lines, '')
+
+
+def _comments(lines):
+    try:
+        for token in tokenize.generate_tokens(_next_line(lines)):
+            if token[0] == tokenize.COMMENT:
+                yield token[2][0], token[1]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # Fall back to looking for comments in every line.
+        for lineno, line in enumerate(lines, 1):
+            index = line.find('#')
+            if index != -1:
+                yield lineno, line[index:]
+
+
+def build_noqa_map(lines):
+    """Find noqa comments in *lines* in a single pass.
+
+    Return a (skip_file, noqa_map) tuple. *skip_file* is True if the file
+    contains a '# flake8: noqa' comment. *noqa_map* maps line numbers to
+    a tuple of suppressed code prefixes, or to None if all codes are
+    suppressed on that line.
+    """
+    noqa_map = {}
+    if not any('noqa' in line.lower() for line in lines):
+        return False, noqa_map
+    for lineno, comment in _comments(lines):
+        file_match = _file_noqa_re.search(comment)
+        if file_match is not None:
+            # flake8 ignores '# flake8: noqa: E123' instead of skipping the
+            # whole file.
+            if file_match.group('codes') is None:
+                return True, {}
+            continue
+        match = _noqa_re.search(comment)
+        if match is None:
+            continue
+        codes = match.group('codes')
+        if codes is None:
+            noqa_map[lineno] = None
+        else:
+            noqa_map[lineno] = tuple(
+                code.upper() for code in re.split(r'[,\s]+', codes) if code
+            )
+    return False, noqa_map
+
+
+# Directories skipped by default. Same as flake8's default --exclude.
+DEFAULT_EXCLUDE = ('.svn', 'CVS', '.bzr', '.hg', '.git', '__pycache__', '.tox', '.eggs', '*.egg')
+
+OUTPUT_FORMAT = '%(path)s:%(row)d:%(col)d: %(text)s'
+
+
+def filter_noqa(lines, violations):
+    """Yield the violations that aren't silenced by noqa comments in *lines*.
+
+    *violations* may be an iterator. The comments are only looked up once
+    the first violation is found.
+    """
+    noqa_map = None
+    for violation in violations:
+        if noqa_map is None:
+            skip_file, noqa_map = build_noqa_map(lines)
+            if skip_file:
+                return
+        lineno = violation.lineno
+        if lineno in noqa_map:
+            codes = noqa_map[lineno]
+            if codes is None or violation.code.startswith(codes):
                 continue
-            yield lineno, col_offset, message, rtype
+        yield violation
+
+
+def _is_excluded(path, exclude):
+    basename = os.path.basename(path)
+    return any(fnmatch.fnmatch(basename, pattern) for pattern in exclude)
+
+
+def discover_files(paths, exclude=DEFAULT_EXCLUDE):
+    """Return a sorted list of Python files found in *paths*."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [d for d in dirnames if not _is_excluded(d, exclude)]
+                for filename in filenames:
+                    if filename.endswith('.py') and not _is_excluded(filename, exclude):
+                        found.append(os.path.join(dirpath, filename))
+        elif not _is_excluded(path, exclude):
+            # Explicitly passed files are checked regardless of their extension.
+            found.append(path)
+    return sorted(set(found))
+
+
+# Location of the index built by get_project_index() as
+# '<key>:<path>'. Child processes inherit it.
+PROJECT_INDEX_ENV = 'HOLVI_PROJECT_INDEX'
+
+
+def get_project_index(paths, exclude=None):
+    """Return a ProjectIndex of *paths*.
+
+    The index is written to a temporary file that is removed when the
+    process that built it exits. Worker processes that parse the options
+    again (e.g. flake8 on Windows) find the file through the
+    HOLVI_PROJECT_INDEX environment variable instead of building another
+    index.
+    """
+    key = source_digest('\0'.join(
+        sorted(os.path.abspath(path) for path in paths) + ['--'] + sorted(exclude or ())
+    ))
+    value = os.environ.get(PROJECT_INDEX_ENV, '')
+    if value.startswith(key + ':'):
+        try:
+            return ProjectIndex(value[len(key) + 1:])
+        except (IOError, OSError, ValueError):
+            pass
+    import tempfile
+
+    fd, path = tempfile.mkstemp(prefix='holvi-index-', suffix='.txt')
+    os.close(fd)
+    pid = os.getpid()
+
+    def remove():
+        # Forked worker processes inherit atexit handlers.
+        if os.getpid() == pid:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    atexit.register(remove)
+    index = ProjectIndex.build(paths, path, exclude)
+    os.environ[PROJECT_INDEX_ENV] = '%s:%s' % (key, path)
+    return index
+
+
+def check_file(path):
+    """Check *path* with the configured HolviChecker.
+
+    Return a list of (row, col, text) tuples where col is 1-indexed like
+    in the output of flake8.
+    """
+    return _check_plugin(HolviChecker(None, path, None))
+
+
+def check_source(name, source):
+    """Check the in-memory *source* of the module *name*.
+
+    The result is the same as the result of check_file(). *name* is only
+    used to report the violations and to look the module up in the diff
+    and the cache.
+    """
+    return _check_plugin(HolviChecker(None, name, source.splitlines(True)))
+
+
+def _check_plugin(plugin):
+    try:
+        if plugin.lines is None:
+            plugin.load_file()
+        violations = [
+            (lineno, col_offset + 1, message)
+            for lineno, col_offset, message, _ in plugin.run()
+        ]
+        # The file may not have been parsed at all if none of the checks
+        # can be triggered. Report syntax errors like flake8 does.
+        if plugin.tree is None and not plugin.cached and plugin.lines:
+            parse_source(''.join(plugin.lines))
+        return violations
+    except SyntaxError as exc:
+        return [(exc.lineno or 1, exc.offset or 1, 'E999 SyntaxError: %s' % exc.msg)]
+    except (IOError, OSError, UnicodeDecodeError) as exc:
+        return [(1, 1, 'E902 %s: %s' % (type(exc).__name__, exc))]
+
+
+# HolviChecker attributes set by parse_options() that are copied to workers.
+_worker_settings = (
+    'ignore_warnings',
+    'cache',
+    'changed_lines',
+    'stats',
+    'enabled_codes',
+    'relative_imports',
+    'extra_relative_imports',
+    'module_index',
+    'project_index',
+    'max_violations',
+)
+
+
+def _configure_worker(settings):
+    for name, value in settings.items():
+        setattr(HolviChecker, name, value)
+
+
+def check_files(paths, jobs=1):
+    """Check *paths* and yield (path, violations) pairs in the given order.
+
+    When *jobs* is greater than one, files are distributed over a process
+    pool in chunks. Results are still yielded in the order of *paths* as
+    soon as they are available.
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, check_file(path)
+        return
+    chunksize = max(1, min(64, len(paths) // (jobs * 4)))
+    for item in zip(paths, _imap(check_file, paths, jobs, chunksize)):
+        yield item
+
+
+def check_sources(sources, jobs=1):
+    """Check an iterable of (name, source) pairs of in-memory modules.
+
+    Yield (name, violations) pairs in the given order as soon as each
+    source is checked. See check_source() for the format of violations.
+    Options are read from HolviChecker, so call HolviChecker.parse_options()
+    once before checking any sources. *sources* is consumed lazily and
+    may be a generator. When *jobs* is greater than one, sources are
+    checked in a process pool and at most two chunks of sources per job
+    are read ahead.
+    """
+    if jobs <= 1:
+        for name, source in sources:
+            yield name, check_source(name, source)
+        return
+    # Pairs are sent to the pool as they are consumed, so a small chunk
+    # size keeps the first results coming quickly.
+    for name, violations in _imap(_check_source_name, sources, jobs, 4):
+        yield name, violations
+
+
+def _check_source_name(item):
+    return item[0], check_source(*item)
+
+
+def _map_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+
+def _imap(func, iterable, jobs, chunksize):
+    import multiprocessing
+
+    # The pool is configured explicitly so that it works when worker
+    # processes don't inherit class attributes (e.g. on Windows).
+    pool = multiprocessing.Pool(
+        jobs,
+        initializer=_configure_worker,
+        initargs=(dict(
+            (name, getattr(HolviChecker, name)) for name in _worker_settings
+        ),),
+    )
+    try:
+        # Pool.imap() reads the whole iterable in a background thread, so
+        # chunks are submitted here and only a few of them are kept in
+        # flight. That keeps the consumption of *iterable* lazy.
+        iterator = iter(iterable)
+        pending = collections.deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < jobs * 2:
+                chunk = list(itertools.islice(iterator, chunksize))
+                if chunk:
+                    pending.append(pool.apply_async(_map_chunk, (func, chunk)))
+                else:
+                    exhausted = True
+            if not pending:
+                break
+            for result in pending.popleft().get():
+                yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+# Checks whose violations fix_file() can fix. Fixes of HLVE310 and HLVE314
+# use six, so 'import six' is added to modules that don't import it yet.
+FIXABLE_CODES = frozenset(['HLVE014', 'HLVE015', 'HLVE309', 'HLVE310', 'HLVE314'])
+
+# Maximum number of times fix_file() rewrites a source. Each pass after the
+# first one only fixes violations in the code that the previous pass rewrote.
+MAX_FIX_PASSES = 5
+
+# Names in six.moves that are attributes of other modules instead of
+# modules. Imports of their Python 2 modules can't be rewritten.
+_six_moved_attributes = frozenset(['cStringIO'])
+
+_open_brackets = frozenset(['(', '[', '{'])
+_close_brackets = frozenset([')', ']', '}'])
+
+
+def _fix_edit(source, tokens, index, violation, imports):
+    """Return an Edit that fixes *violation* or None if it can't be fixed.
+
+    *index* is the index of the token at the location of the violation and
+    *imports* maps the locations of import statements to their nodes.
+    """
+    from holvi_lib2to3.rewrite import Edit
+
+    code = violation.code
+    strings = [token.string for token in tokens[index:index + 5]]
+    if code in ('HLVE014', 'HLVE015', 'HLVE310'):
+        if strings[:3] != ['self', '.', violation.args[0]]:
+            return None
+        name = tokens[index + 2]
+        if code == 'HLVE014':
+            return Edit(name.start, name.end, 'assertEqual')
+        if code == 'HLVE015':
+            return Edit(name.start, name.end, violation.args[1])
+        # self.assertItemsEqual(a, b) -> six.assertCountEqual(self, a, b)
+        if strings[3] != '(':
+            return None
+        if strings[4] == ')':
+            separator = ''
+        elif '\n' in source[tokens[index + 3].end:tokens[index + 4].start]:
+            separator = ','
+        else:
+            separator = ', '
+        return Edit(
+            tokens[index].start, tokens[index + 3].end,
+            'six.%s(self%s' % (violation.args[1], separator),
+        )
+    if code == 'HLVE314':
+        # d.iteritems() -> six.iteritems(d)
+        depth = 0
+        for i in range(index, len(tokens) - 3):
+            token = tokens[i]
+            if token.type == tokenize.NEWLINE:
+                break
+            if token.string in _open_brackets:
+                depth += 1
+            elif token.string in _close_brackets:
+                depth -= 1
+                if depth < 0:
+                    break
+            elif (
+                depth == 0 and
+                token.string == '.' and
+                tokens[i + 1].string in python2_builtin_methods
+            ):
+                if tokens[i + 2].string != '(' or tokens[i + 3].string != ')':
+                    break
+                obj = source[tokens[index].start:token.start]
+                return Edit(
+                    tokens[index].start, tokens[i + 3].end,
+                    'six.%s(%s)' % (tokens[i + 1].string, obj),
+                )
+        return None
+    if code == 'HLVE309':
+        node = imports.get((violation.lineno, violation.col_offset))
+        mod_name, new_name = violation.args
+        # six.moves.cStringIO is io.StringIO in Python 3.
+        if new_name in _six_moved_attributes:
+            return None
+        new_module = 'six.moves.' + new_name
+        if isinstance(node, ast.ImportFrom):
+            # from urlparse import urljoin -> from six.moves.urllib.parse import urljoin
+            if node.level or strings[:2] != ['from', mod_name]:
+                return None
+            return Edit(tokens[index + 1].start, tokens[index + 1].end, new_module)
+        if node is None or len(node.names) != 1 or strings[:2] != ['import', mod_name]:
+            return None
+        # import urlparse -> from six.moves.urllib import parse as urlparse
+        package, name = new_module.rsplit('.', 1)
+        asname = node.names[0].asname or mod_name
+        end = tokens[index + 3] if strings[2] == 'as' else tokens[index + 1]
+        text = 'from %s import %s' % (package, name)
+        if asname != name:
+            text += ' as %s' % asname
+        return Edit(tokens[index].start, end.end, text)
+    return None
+
+
+# Blocks whose imports bind module-level names.
+_module_block_types = _node_types(
+    'If', 'Try', 'TryStar', 'TryExcept', 'TryFinally', 'ExceptHandler',
+)
+
+
+def _imports_six(tree):
+    """Return True if an import binds the name six at the module level.
+
+    Imports in top-level if and try blocks count too, e.g. 'from
+    django.utils import six' or fallbacks in 'except ImportError:'.
+    """
+    statements = list(tree.body)
+    while statements:
+        stmt = statements.pop()
+        if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            for alias in stmt.names:
+                if (alias.asname or alias.name.split('.')[0]) == 'six':
+                    return True
+        elif isinstance(stmt, _module_block_types):
+            for field in ('body', 'handlers', 'orelse', 'finalbody'):
+                statements.extend(getattr(stmt, field, None) or ())
+    return False
+
+
+def _six_import_line(tree):
+    """Return the line where 'import six' is inserted or None if there's no
+    place for it.
+
+    It goes above the first top-level statement after the docstring and
+    __future__ imports.
+    """
+    previous_line = 0
+    for index, stmt in enumerate(tree.body):
+        if (index == 0 and _is_docstring(stmt)) or (
+            isinstance(stmt, ast.ImportFrom) and stmt.module == '__future__'
+        ):
+            previous_line = stmt.lineno
+            continue
+        start = _statement_start(stmt)
+        # E.g. '"""Docstring."""; import os'
+        return start if start > previous_line else None
+    return None
+
+
+def _line_offsets(source):
+    return [0] + [match.end() for match in re.finditer('\n', source)]
+
+
+def fix_source(source, tree, violations):
+    """Fix *violations* found in *source* by HolviVisitor.
+
+    *tree* is the parsed *source*. All fixes are applied in a single pass.
+    Violations that can't be fixed, including ones whose fixes overlap
+    other fixes, are skipped. Return (new_source, fixed, changed_lines)
+    where *fixed* is the list of fixed violations and *changed_lines* is
+    a sorted list of inclusive (start, end) ranges of the rewritten lines
+    in *new_source*.
+    """
+    from holvi_lib2to3.rewrite import Edit
+    from holvi_lib2to3.rewrite import apply_edits
+    from holvi_lib2to3.rewrite import generate_tokens
+
+    violations = [v for v in violations if v.code in FIXABLE_CODES]
+    if not violations:
+        return source, [], []
+    ignored = (tokenize.COMMENT, tokenize.NL, tokenize.INDENT, tokenize.DEDENT)
+    tokens = [token for token in generate_tokens(source) if token.type not in ignored]
+    positions = dict((token.start, index) for index, token in enumerate(tokens))
+    imports = {}
+    if any(violation.code == 'HLVE309' for violation in violations):
+        imports = dict(
+            ((node.lineno, node.col_offset), node)
+            for node in ast.walk(tree) if isinstance(node, (ast.Import, ast.ImportFrom))
+        )
+    line_offsets = _line_offsets(source)
+
+    fixes = []
+    for violation in violations:
+        line_start = line_offsets[violation.lineno - 1]
+        # col_offset counts UTF-8 bytes.
+        prefix = source[line_start:line_start + violation.col_offset]
+        prefix = prefix.encode('utf-8')[:violation.col_offset].decode('utf-8', 'ignore')
+        index = positions.get(line_start + len(prefix))
+        if index is None:
+            continue
+        edit = _fix_edit(source, tokens, index, violation, imports)
+        if edit is not None:
+            fixes.append((edit, violation))
+    fixes.sort(key=lambda fix: fix[0])
+
+    edits = []
+    fixed = []
+    end = 0
+    for edit, violation in fixes:
+        # Overlapping fixes, e.g. nested iteritems() calls, are left for
+        # the next run.
+        if edit.start < end:
+            continue
+        end = edit.end
+        edits.append(edit)
+        fixed.append(violation)
+    if any(violation.code in ('HLVE310', 'HLVE314') for violation in fixed) and not _imports_six(tree):
+        line = _six_import_line(tree)
+        if line is None:
+            kept = [
+                (edit, violation) for edit, violation in zip(edits, fixed)
+                if violation.code not in ('HLVE310', 'HLVE314')
+            ]
+            edits = [edit for edit, _ in kept]
+            fixed = [violation for _, violation in kept]
+        else:
+            newline = '\r\n' if '\r\n' in source else '\n'
+            offset = line_offsets[line - 1]
+            edits.insert(0, Edit(offset, offset, 'import six' + newline))
+    if not edits:
+        return source, [], []
+
+    new_source = apply_edits(source, edits)
+    new_offsets = _line_offsets(new_source)
+    changed_lines = []
+    shift = 0
+    for edit in sorted(edits):
+        start = edit.start + shift
+        end = start + max(len(edit.text) - 1, 0)
+        shift += len(edit.text) - (edit.end - edit.start)
+        start_line = bisect.bisect_right(new_offsets, start)
+        end_line = bisect.bisect_right(new_offsets, end)
+        if changed_lines and changed_lines[-1][1] >= start_line:
+            changed_lines[-1] = (changed_lines[-1][0], max(changed_lines[-1][1], end_line))
+        else:
+            changed_lines.append((start_line, end_line))
+    return new_source, fixed, changed_lines
+
+
+_coding_re = re.compile(r'^([ \t\f]*#.*?coding[:=][ \t]*)([-\w.]+)')
+
+
+def _parse_text(source):
+    """Parse the decoded *source*.
+
+    Python 2 refuses unicode sources with an encoding declaration, so they
+    are parsed as UTF-8 with the declaration changed to match. Column
+    offsets count UTF-8 bytes in both cases.
+    """
+    if not isinstance(source, str):
+        # unicode in Python 2.
+        lines = source.split(u'\n', 2)
+        lines[:2] = [_coding_re.sub(u'\\1utf-8', line) for line in lines[:2]]
+        source = u'\n'.join(lines).encode('utf-8')
+    return ast.parse(source)
+
+
+def fix_file(path):
+    """Fix the violations of FIXABLE_CODES in *path* in place.
+
+    The file is read once and written once. After all fixes are applied,
+    only the rewritten statements are checked again. Fixes that overlapped
+    other fixes are then applied in another pass over the new source. The
+    file is left untouched if the fixed code doesn't parse. Options are
+    read from HolviChecker. Return (fixed, error) where *fixed* is the
+    number of fixed violations and *error* is None or a message that
+    explains why the file wasn't fixed.
+    """
+    import io
+
+    from holvi_lib2to3.main import read_source
+
+    try:
+        source, encoding = read_source(path)
+    except (IOError, OSError, SyntaxError, UnicodeDecodeError) as exc:
+        return 0, 'E902 %s: %s' % (type(exc).__name__, exc)
+    codes = HolviChecker.get_prefilter().live_rules(source) & FIXABLE_CODES
+    if not codes:
+        return 0, None
+    try:
+        tree = _parse_text(source)
+    except SyntaxError:
+        # Reported as E999 by the checks.
+        return 0, None
+
+    total = 0
+    changed_lines = None
+    for _ in range(MAX_FIX_PASSES):
+        visitor = HolviVisitor(HolviChecker.ignore_warnings, codes)
+        if changed_lines is None:
+            visitor.visit(tree)
+            violations = visitor.violations
+        else:
+            visitor.visit_changed(tree, changed_lines)
+            violations = [
+                violation for violation in visitor.violations
+                if lines_overlap(changed_lines, violation.lineno, violation.lineno)
+            ]
+        violations = list(filter_noqa(source.splitlines(True), violations))
+        source, fixed, changed_lines = fix_source(source, tree, violations)
+        if not fixed:
+            break
+        total += len(fixed)
+        try:
+            tree = _parse_text(source)
+        except SyntaxError as exc:
+            return 0, 'not fixed, the fixed code has a syntax error: %s' % exc
+    if not total:
+        return 0, None
+
+    try:
+        with io.open(path, 'w', encoding=encoding, newline='') as f:
+            f.write(source)
+    except (IOError, OSError) as exc:
+        return 0, 'E902 %s: %s' % (type(exc).__name__, exc)
+    return total, None
+
+
+def fix_files(paths, jobs=1):
+    """Fix *paths* and yield (path, (fixed, error)) pairs in the given order.
+
+    See fix_file() and check_files().
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, fix_file(path)
+        return
+    chunksize = max(1, min(64, len(paths) // (jobs * 4)))
+    for item in zip(paths, _imap(fix_file, paths, jobs, chunksize)):
+        yield item
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class PollingWatcher(object):
+    """Find changed Python files by scanning *paths* every *interval* seconds."""
+
+    def __init__(self, paths, exclude=DEFAULT_EXCLUDE, interval=1.0):
+        # Changed paths are reported as absolute paths like LintServer expects.
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.exclude = exclude
+        self.interval = interval
+        self.signatures = self._scan()
+
+    def _scan(self):
+        return dict(
+            (path, _file_signature(path)) for path in discover_files(self.paths, self.exclude)
+        )
+
+    def wait(self):
+        """Block until the next scan and return the changed paths.
+
+        Paths of deleted files are included.
+        """
+        time.sleep(self.interval)
+        signatures = self._scan()
+        changed = set(self.signatures) ^ set(signatures)
+        changed.update(
+            path for path, signature in signatures.items()
+            if self.signatures.get(path, signature) != signature
+        )
+        self.signatures = signatures
+        return sorted(changed)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """Find changed Python files with inotify.
+
+    Raise OSError if inotify is not available.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, paths, exclude=DEFAULT_EXCLUDE, interval=1.0):
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self.exclude = exclude
+        self.interval = interval
+        self.fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(self._get_errno(), 'inotify_init1() failed')
+        # Watch descriptor - directory.
+        self.directories = {}
+        try:
+            for path in paths:
+                path = os.path.abspath(path)
+                if os.path.isdir(path):
+                    self._watch_tree(path)
+                else:
+                    self._watch(os.path.dirname(path))
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, directory):
+        directory = os.path.abspath(directory)
+        wd = self._libc.inotify_add_watch(
+            self.fd, directory.encode(sys.getfilesystemencoding()), self.MASK,
+        )
+        if wd < 0:
+            raise OSError(self._get_errno(), 'inotify_add_watch() failed: %s' % directory)
+        self.directories[wd] = directory
+
+    def _watch_tree(self, root):
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not _is_excluded(d, self.exclude)]
+            self._watch(dirpath)
+
+    def wait(self):
+        """Block for at most *interval* seconds and return the changed paths."""
+        import select
+        import struct
+
+        if not select.select([self.fd], [], [], self.interval)[0]:
+            return []
+        data = os.read(self.fd, 65536)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+            offset += 16
+            name = data[offset:offset + length].rstrip(b'\0').decode(sys.getfilesystemencoding())
+            offset += length
+            directory = self.directories.get(wd)
+            if directory is None or _is_excluded(name, self.exclude):
+                continue
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self._watch_tree(path)
+                    changed.update(discover_files([path], self.exclude))
+            elif name.endswith('.py'):
+                changed.add(path)
+        return sorted(changed)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def get_watcher(paths, exclude=DEFAULT_EXCLUDE, interval=1.0):
+    """Return an InotifyWatcher or a PollingWatcher if inotify isn't available."""
+    try:
+        return InotifyWatcher(paths, exclude, interval)
+    except OSError:
+        return PollingWatcher(paths, exclude, interval)
+
+
+class LintServer(object):
+    """Check files on request and keep the results in memory.
+
+    Clients connect to the Unix socket *socket_path*, send one path per
+    line and close their side of the connection (or send an empty line).
+    The violations are sent back in the output format of flake8. Results
+    of at most *max_entries* files are kept by absolute path and they are
+    reused until the size or the modification time of the file changes. If
+    *watcher* is given, files reported by it are re-checked in the
+    background.
+    """
+
+    def __init__(self, socket_path, max_entries=1000, watcher=None):
+        import threading
+
+        self.socket_path = socket_path
+        self.max_entries = max_entries
+        self.watcher = watcher
+        # Absolute path - (signature, violations, statements).
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.socket = None
+        self.running = False
+
+    def check(self, path):
+        """Return violations of *path* like check_file() does."""
+        path = os.path.abspath(path)
+        signature = _file_signature(path)
+        with self.lock:
+            entry = self.entries.pop(path, None)
+            if entry is not None and entry[0] == signature and signature is not None:
+                self.entries[path] = entry
+                return entry[1]
+        plugin = HolviChecker(None, path, None)
+        # Only re-visit the statements that changed since the last check.
+        plugin.incremental = True
+        if entry is not None:
+            plugin.statements = entry[2]
+        violations = _check_plugin(plugin)
+        with self.lock:
+            self.entries.pop(path, None)
+            if len(self.entries) >= self.max_entries:
+                self.entries.popitem(last=False)
+            self.entries[path] = (signature, violations, plugin.statements)
+        return violations
+
+    def handle(self, connection):
+        data = b''
+        while not data.endswith(b'\n\n'):
+            chunk = connection.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        output = []
+        for path in data.decode('utf-8').splitlines():
+            if not path:
+                continue
+            for row, col, text in self.check(path):
+                output.append(OUTPUT_FORMAT % {'path': path, 'row': row, 'col': col, 'text': text})
+        connection.sendall(''.join(line + '\n' for line in output).encode('utf-8'))
+
+    def _watch(self):
+        while self.running:
+            for path in self.watcher.wait():
+                if os.path.exists(path):
+                    self.check(path)
+                else:
+                    with self.lock:
+                        self.entries.pop(os.path.abspath(path), None)
+
+    def serve_forever(self):
+        import socket
+        import stat
+        import threading
+
+        if os.path.exists(self.socket_path) and stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+            # Left behind by a previous server.
+            os.remove(self.socket_path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(self.socket_path)
+        self.socket.listen(16)
+        # Don't block shutdown() for longer than a second.
+        self.socket.settimeout(1.0)
+        self.running = True
+        thread = None
+        if self.watcher is not None:
+            thread = threading.Thread(target=self._watch)
+            thread.daemon = True
+            thread.start()
+        try:
+            while self.running:
+                try:
+                    connection, _ = self.socket.accept()
+                except socket.timeout:
+                    continue
+                try:
+                    connection.settimeout(None)
+                    self.handle(connection)
+                except (IOError, OSError):
+                    pass
+                finally:
+                    connection.close()
+        finally:
+            self.running = False
+            self.socket.close()
+            os.remove(self.socket_path)
+            if thread is not None:
+                thread.join()
+                self.watcher.close()
+
+    def shutdown(self):
+        self.running = False
+
+
+def query_server(socket_path, paths):
+    """Send *paths* to the LintServer listening on *socket_path*.
+
+    Return the output lines.
+    """
+    import socket
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        client.sendall(''.join(path + '\n' for path in paths).encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        data = b''
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        client.close()
+    return data.decode('utf-8').splitlines()
+
+
+def main(argv=None):
+    """Run flake8-holvi checks without flake8.
+
+    The output and the exit code are compatible with flake8.
+    """
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(
+        prog='python -m flake8_holvi',
+        description='Run flake8-holvi checks without flake8.',
+    )
+    parser.add_argument('paths', nargs='*', default=['.'], metavar='path')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+        help='Number of worker processes. (Default: %(default)s)',
+    )
+    parser.add_argument(
+        '--exclude', default=','.join(DEFAULT_EXCLUDE),
+        help='Comma-separated list of file and directory patterns to skip. '
+             '(Default: %(default)s)',
+    )
+    parser.add_argument(
+        '--exit-zero', action='store_true',
+        help='Exit with status code "0" even if there are violations.',
+    )
+    parser.add_argument(
+        '--select', default=None,
+        help='Comma-separated list of codes or code prefixes to report.',
+    )
+    parser.add_argument(
+        '--ignore', default=None,
+        help='Comma-separated list of codes or code prefixes to skip.',
+    )
+    parser.add_argument(
+        '--ignore-warnings', action='store_true',
+        help='Do not report checks added as warnings.',
+    )
+    parser.add_argument(
+        '--holvi-cache-dir', default=None,
+        help='Cache results of unchanged files in this directory.',
+    )
+    parser.add_argument(
+        '--holvi-cache-size', type=int, default=10000,
+        help='Maximum number of files kept in the cache. (Default: %(default)s)',
+    )
+    parser.add_argument(
+        '--holvi-diff', default=None, metavar='REVISION_RANGE',
+        help='Only check lines changed in the given git revision range.',
+    )
+    parser.add_argument(
+        '--holvi-stats', default=None, metavar='PATH',
+        help='Write timings and counters of the checks to PATH as JSON.',
+    )
+    parser.add_argument(
+        '--holvi-relative-imports', default='',
+        help='Comma-separated list of additional module names to report as '
+             'implicit relative imports.',
+    )
+    parser.add_argument(
+        '--holvi-discover-relative-imports', action='store_true',
+        help='Report imports of modules found in the package of the checked '
+             'file as implicit relative imports.',
+    )
+    parser.add_argument(
+        '--holvi-project-index', action='store_true',
+        help='Index the modules and exception classes of the checked paths '
+             'once and share the index with all worker processes.',
+    )
+    parser.add_argument(
+        '--holvi-target-version', default='py2', choices=sorted(target_version_excludes),
+        help='Python version that the checked code targets. py3 turns off the '
+             'Python 3 migration checks (HLVE3xx and HLVW3xx). (Default: %(default)s)',
+    )
+    parser.add_argument(
+        '--holvi-max-violations', type=int, default=0,
+        help='Stop checking a file after reporting this many violations. '
+             '0 means no limit. (Default: %(default)s)',
+    )
+    parser.add_argument(
+        '--fix', action='store_true',
+        help='Fix violations of %s in place before reporting the remaining '
+             'violations.' % ', '.join(sorted(FIXABLE_CODES)),
+    )
+    parser.add_argument(
+        '--serve', default=None, metavar='SOCKET',
+        help='Keep running and check files requested through the Unix socket '
+             'SOCKET. Changed files under the given paths are re-checked in '
+             'the background.',
+    )
+    parser.add_argument(
+        '--serve-cache-size', type=int, default=1000,
+        help='Maximum number of files whose results are kept in memory by '
+             '--serve. (Default: %(default)s)',
+    )
+    parser.add_argument(
+        '--connect', default=None, metavar='SOCKET',
+        help='Check the given paths with a server started with --serve.',
+    )
+    options = parser.parse_args(argv)
+    HolviChecker.parse_options(options)
+
+    exclude = [pattern.strip() for pattern in options.exclude.split(',') if pattern.strip()]
+    if options.serve:
+        server = LintServer(
+            options.serve, options.serve_cache_size,
+            watcher=get_watcher(options.paths, exclude),
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    paths = discover_files(options.paths, exclude)
+    if options.fix:
+        for path, (fixed, error) in fix_files(paths, options.jobs):
+            if error is not None:
+                print('%s: %s' % (path, error), file=sys.stderr)
+            elif fixed:
+                print('%s: fixed %d violation(s)' % (path, fixed), file=sys.stderr)
+    if options.connect:
+        output = query_server(options.connect, [os.path.abspath(path) for path in paths])
+        for line in output:
+            print(line)
+        if output and not options.exit_zero:
+            return 1
+        return 0
+    if HolviChecker.module_index is not None:
+        # Index the packages once instead of in every worker process.
+        HolviChecker.module_index.index_files(paths)
+    found = False
+    for path, violations in check_files(paths, options.jobs):
+        for row, col, text in violations:
+            found = True
+            print(OUTPUT_FORMAT % {'path': path, 'row': row, 'col': col, 'text': text})
+    if found and not options.exit_zero:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
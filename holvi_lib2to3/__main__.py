@@ -1,5 +1,5 @@
 import sys
 
-from lib2to3.main import main
+from holvi_lib2to3.main import main
 
-sys.exit(main('holvi_lib2to3.fixes'))
+sys.exit(main())
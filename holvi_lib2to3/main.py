@@ -0,0 +1,353 @@
+"""Fast driver for the holvi_lib2to3 fixers.
+
+Sources are rewritten with the tokenize based engine in
+holvi_lib2to3.rewrite. Only files that contain the trigger of at least one
+selected fixer are tokenized, and they are processed in a process pool.
+Content hashes of files that needed no changes can be stored with --cache
+so that they are skipped on the next run. Options of 2to3 that the driver
+doesn't support are handled by lib2to3.main.
+"""
+from __future__ import print_function
+
+import argparse
+import difflib
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import tokenize
+
+from flake8_holvi import __version__
+from holvi_lib2to3.rewrite import FIXERS
+from holvi_lib2to3.rewrite import Rewriter
+
+try:
+    from tokenize import detect_encoding
+except ImportError:
+    # Python 2.
+    from lib2to3.pgen2.tokenize import detect_encoding
+
+FIXER_PKG = 'holvi_lib2to3.fixes'
+
+
+def get_fixer_names(fix=(), nofix=()):
+    """Return the sorted fixer names selected by -f and -x like 2to3 does.
+
+    Raise ValueError if a fixer doesn't exist.
+    """
+    for name in list(fix) + list(nofix):
+        if name != 'all' and name not in FIXERS:
+            raise ValueError("Can't find transformation %s" % name)
+    if not fix or 'all' in fix:
+        requested = set(FIXERS)
+    else:
+        requested = set(fix)
+    return sorted(requested - set(nofix))
+
+
+def get_triggers(fixer_names):
+    """Return the TRIGGER strings of *fixer_names*.
+
+    Return None if any of the fixers doesn't define a trigger, since then
+    every file must be processed.
+    """
+    triggers = []
+    for name in fixer_names:
+        trigger = FIXERS[name].TRIGGER
+        if trigger is None:
+            return None
+        triggers.append(trigger.encode('ascii'))
+    return triggers
+
+
+def find_files(paths):
+    """Return Python files in *paths* in the same order as 2to3 does."""
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            filenames.sort()
+            # Skip hidden directories and files like 2to3 does.
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if not filename.startswith('.') and filename.endswith('.py'):
+                    found.append(os.path.join(dirpath, filename))
+    return found
+
+
+def read_source(filename):
+    """Return the decoded source of *filename* and its encoding."""
+    with open(filename, 'rb') as f:
+        encoding = detect_encoding(f.readline)[0]
+    with io.open(filename, 'r', encoding=encoding, newline='') as f:
+        return f.read(), encoding
+
+
+class FileRecord(object):
+    """Set of content hashes of files that needed no changes.
+
+    The hashes depend on the selected fixers and the version of the
+    package, so a record can be shared between runs with different fixers
+    and files are checked again after an upgrade.
+    """
+
+    def __init__(self, path, fixer_names):
+        self.path = path
+        self.salt = '\0'.join([__version__] + list(fixer_names)).encode('utf-8') + b'\0'
+        self.hashes = set()
+        if path is not None:
+            try:
+                with open(path) as f:
+                    self.hashes = set(json.load(f))
+            except (IOError, OSError, ValueError):
+                pass
+        self.changed = False
+
+    def digest(self, data):
+        return hashlib.sha1(self.salt + data).hexdigest()
+
+    def __contains__(self, digest):
+        return digest in self.hashes
+
+    def add(self, digest):
+        if digest not in self.hashes:
+            self.hashes.add(digest)
+            self.changed = True
+
+    def save(self):
+        if self.path is None or not self.changed:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sorted(self.hashes), f)
+        # os.replace() doesn't exist in Python 2.
+        getattr(os, 'replace', os.rename)(temp_path, self.path)
+
+
+_rewriter = None
+
+
+def _configure_worker(fixer_names):
+    global _rewriter
+    _rewriter = Rewriter([FIXERS[name]() for name in fixer_names])
+
+
+def _refactor_file(filename):
+    """Return (filename, old_text, new_text, encoding, error).
+
+    *new_text* is None and *error* is a (msg, args) tuple if the file
+    couldn't be refactored.
+    """
+    try:
+        old_text, encoding = read_source(filename)
+    except (IOError, OSError) as exc:
+        return filename, None, None, None, ("Can't open %s: %s", (filename, exc))
+    try:
+        new_text = _rewriter.refactor(old_text)
+    except (tokenize.TokenError, IndentationError, SyntaxError) as exc:
+        error = ("Can't parse %s: %s: %s", (filename, type(exc).__name__, exc))
+        return filename, old_text, None, encoding, error
+    return filename, old_text, new_text, encoding, None
+
+
+def refactor_files(filenames, fixer_names, jobs=1):
+    """Refactor *filenames* and yield the results of _refactor_file()."""
+    if jobs <= 1 or len(filenames) <= 1:
+        _configure_worker(fixer_names)
+        for filename in filenames:
+            yield _refactor_file(filename)
+        return
+    pool = multiprocessing.Pool(
+        jobs, initializer=_configure_worker, initargs=(fixer_names,),
+    )
+    try:
+        chunksize = max(1, min(16, len(filenames) // (jobs * 4)))
+        for result in pool.imap(_refactor_file, filenames, chunksize):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+class Reporter(object):
+    """Print diffs, write files and log messages like the 2to3 tool."""
+
+    def __init__(self, write=False, nobackups=False, show_diffs=True):
+        self.write = write
+        self.nobackups = nobackups
+        self.show_diffs = show_diffs
+        self.logger = logging.getLogger('RefactoringTool')
+        self.files = []
+        self.errors = []
+        self.wrote = False
+
+    def log_error(self, msg, *args):
+        self.errors.append((msg, args))
+        self.logger.error(msg, *args)
+
+    def processed_file(self, new_text, filename, old_text, encoding):
+        self.files.append(filename)
+        self.logger.info('Refactored %s', filename)
+        if self.show_diffs:
+            for line in difflib.unified_diff(
+                old_text.splitlines(), new_text.splitlines(), filename, filename,
+                '(original)', '(refactored)', lineterm='',
+            ):
+                print(line)
+        if self.write:
+            self.write_file(new_text, filename, encoding)
+        else:
+            self.logger.debug('Not writing changes to %s', filename)
+
+    def write_file(self, new_text, filename, encoding):
+        if not self.nobackups:
+            backup = filename + '.bak'
+            if os.path.lexists(backup):
+                try:
+                    os.remove(backup)
+                except OSError:
+                    self.logger.info("Can't remove backup %s", backup)
+            try:
+                os.rename(filename, backup)
+            except OSError:
+                self.logger.info("Can't rename %s to %s", filename, backup)
+        try:
+            with io.open(filename, 'w', encoding=encoding, newline='') as f:
+                f.write(new_text)
+        except (IOError, OSError) as exc:
+            self.log_error("Can't write %s: %s", filename, exc)
+            return
+        if not self.nobackups:
+            shutil.copymode(backup, filename)
+        self.logger.debug('Wrote changes to %s', filename)
+        self.wrote = True
+
+    def summarize(self):
+        were = 'were' if self.wrote else 'need to be'
+        if not self.files:
+            self.logger.info('No files %s modified.', were)
+        else:
+            self.logger.info('Files that %s modified:', were)
+            for filename in self.files:
+                self.logger.info(filename)
+        if self.errors:
+            if len(self.errors) == 1:
+                self.logger.info('There was 1 error:')
+            else:
+                self.logger.info('There were %d errors:', len(self.errors))
+            for msg, args in self.errors:
+                self.logger.info(msg, *args)
+
+
+# Options of 2to3 that are passed to lib2to3.main.
+_lib2to3_options = (
+    '-d', '--doctests_only', '-l', '--list-fixes', '-p', '--print-function',
+    '-e', '--exec-function', '-o', '--output-dir', '-W', '--write-unchanged-files',
+    '--add-suffix',
+)
+
+
+def _needs_lib2to3(args):
+    for arg in args:
+        if arg == '-' or arg.split('=', 1)[0] in _lib2to3_options:
+            return True
+    return False
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    if _needs_lib2to3(args):
+        from lib2to3.main import main as lib2to3_main
+
+        return lib2to3_main(FIXER_PKG, args)
+
+    parser = argparse.ArgumentParser(
+        prog='python -m holvi_lib2to3',
+        description='Remove Python 2-only features. Options of 2to3 that are '
+                    'not listed here are supported too.',
+    )
+    parser.add_argument('paths', nargs='+', metavar='file|dir')
+    parser.add_argument(
+        '-f', '--fix', action='append', default=[],
+        help='Each FIX specifies a transformation; default: all',
+    )
+    parser.add_argument(
+        '-x', '--nofix', action='append', default=[],
+        help='Prevent a transformation from being run',
+    )
+    parser.add_argument(
+        '-j', '--processes', type=int, default=multiprocessing.cpu_count(),
+        help='Number of worker processes. (Default: %(default)s)',
+    )
+    parser.add_argument('-v', '--verbose', action='store_true', help='More verbose logging')
+    parser.add_argument(
+        '--no-diffs', action='store_true', help="Don't show diffs of the refactoring",
+    )
+    parser.add_argument('-w', '--write', action='store_true', help='Write back modified files')
+    parser.add_argument(
+        '-n', '--nobackups', action='store_true', help="Don't write backups for modified files",
+    )
+    parser.add_argument(
+        '--cache', default=None, metavar='PATH',
+        help='Remember files that need no changes in PATH and skip them next time.',
+    )
+    options = parser.parse_args(args)
+    if not options.write and options.nobackups:
+        parser.error("Can't use -n without -w")
+    if not options.write and options.no_diffs:
+        print("WARNING: not writing files and not printing diffs; that's not "
+              "very useful", file=sys.stderr)
+
+    level = logging.DEBUG if options.verbose else logging.INFO
+    logging.basicConfig(format='%(name)s: %(message)s', level=level)
+
+    try:
+        fixer_names = get_fixer_names(options.fix, options.nofix)
+    except ValueError as exc:
+        parser.error(str(exc))
+    triggers = get_triggers(fixer_names)
+    record = FileRecord(options.cache, fixer_names)
+    reporter = Reporter(options.write, options.nobackups, not options.no_diffs)
+
+    # Reading files is cheap compared to tokenizing them, so files that
+    # can't be changed by any of the fixers are skipped here.
+    candidates = []
+    digests = {}
+    for filename in find_files(options.paths):
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError) as exc:
+            reporter.log_error("Can't open %s: %s", filename, exc)
+            continue
+        if triggers is not None and not any(trigger in data for trigger in triggers):
+            continue
+        digest = digests[filename] = record.digest(data)
+        if digest not in record:
+            candidates.append(filename)
+
+    results = refactor_files(candidates, fixer_names, options.processes)
+    for filename, old_text, new_text, encoding, error in results:
+        if error is not None:
+            reporter.log_error(error[0], *error[1])
+        elif new_text == old_text:
+            reporter.logger.debug('No changes to %s', filename)
+            record.add(digests[filename])
+        else:
+            reporter.processed_file(new_text, filename, old_text, encoding)
+    record.save()
+    reporter.summarize()
+    return int(bool(reporter.errors))
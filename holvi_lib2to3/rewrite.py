@@ -0,0 +1,183 @@
+"""Rewriting engine for holvi_lib2to3 fixers.
+
+Fixers find the regions to change in the tokens of a module and return
+them as edits. All edits are applied to the source at once, so everything
+else, including whitespace and comments, is left untouched. It's much
+faster than lib2to3, which builds a concrete syntax tree with a pure
+Python parser, and it works on Python versions that don't have lib2to3.
+"""
+import collections
+import io
+import tokenize
+
+# start and end are offsets in the source.
+Token = collections.namedtuple('Token', ['type', 'string', 'start', 'end'])
+
+# Replace source[start:end] with text.
+Edit = collections.namedtuple('Edit', ['start', 'end', 'text'])
+
+_ignored_token_types = frozenset([tokenize.COMMENT, tokenize.NL])
+
+
+def generate_tokens(source):
+    """Tokenize *source* and return a list of Token instances.
+
+    *source* is unicode or a native string. Raise tokenize.TokenError,
+    IndentationError or SyntaxError if the source can't be tokenized.
+    """
+    # Offset of the first character of each line.
+    offsets = [0]
+    if isinstance(source, bytes):
+        # A native string in Python 2.
+        readline = io.BytesIO(source).readline
+    else:
+        readline = io.StringIO(source).readline
+
+    def read_line():
+        line = readline()
+        if line:
+            offsets.append(offsets[-1] + len(line))
+        return line
+
+    tokens = []
+    for token_type, string, start, end, _ in tokenize.generate_tokens(read_line):
+        tokens.append(Token(
+            token_type,
+            string,
+            offsets[start[0] - 1] + start[1],
+            offsets[end[0] - 1] + end[1],
+        ))
+    return tokens
+
+
+def top_level_statements(tokens):
+    """Yield token lists of simple statements and compound statement headers
+    at the top level of a module.
+
+    Comments and non-logical newlines are left out. Every list ends with
+    a NEWLINE token.
+    """
+    depth = 0
+    statement = []
+    for token in tokens:
+        if token.type == tokenize.INDENT:
+            depth += 1
+        elif token.type == tokenize.DEDENT:
+            depth -= 1
+        elif depth == 0 and token.type not in _ignored_token_types:
+            if token.type == tokenize.ENDMARKER:
+                break
+            statement.append(token)
+            if token.type == tokenize.NEWLINE:
+                yield statement
+                statement = []
+
+
+def skip_whitespace(source, offset):
+    """Return the offset of the first non-whitespace character after *offset*."""
+    while offset < len(source) and source[offset].isspace():
+        offset += 1
+    return offset
+
+
+class Fixer(object):
+    """Base class of fixers.
+
+    Subclasses implement get_edits(). TRIGGER is a string that appears in
+    every source that the fixer can change. Other sources aren't even
+    tokenized.
+    """
+
+    TRIGGER = None
+
+    def get_edits(self, source, tokens):
+        """Return a list of Edit instances for *source*.
+
+        *tokens* is the result of generate_tokens(source). Edits must not
+        overlap.
+        """
+        raise NotImplementedError
+
+
+class FixFuture(Fixer):
+    """Remove __future__ imports and the whitespace that follows them.
+
+    Comments above and below the imports are kept. The output is the same
+    as the output of holvi_lib2to3.fixes.fix_future.
+    """
+
+    TRIGGER = '__future__'
+
+    def get_edits(self, source, tokens):
+        edits = []
+        for statement in top_level_statements(tokens):
+            strings = [token.string for token in statement[:4]]
+            # Like the lib2to3 fixer, imports in parentheses are kept.
+            if strings[:3] != ['from', '__future__', 'import'] or strings[3] == '(':
+                continue
+            # Statements like 'from __future__ import x; y = 1' are kept.
+            if any(token.string == ';' for token in statement):
+                continue
+            # The pattern of the lib2to3 fixer only matches '\n', so imports
+            # that end with '\r\n' are kept too.
+            if statement[-1].string != '\n':
+                continue
+            end = skip_whitespace(source, statement[-1].end)
+            edits.append(Edit(statement[0].start, end, ''))
+        return edits
+
+
+# Fixer name - fixer class. Names are used with the -f and -x options.
+FIXERS = {
+    'future': FixFuture,
+}
+
+
+class Rewriter(object):
+    """Apply *fixers* to sources in a single pass."""
+
+    def __init__(self, fixers):
+        self.fixers = fixers
+
+    def refactor(self, source):
+        """Return the refactored version of *source*.
+
+        Raise tokenize.TokenError, IndentationError or SyntaxError if the
+        source can't be tokenized.
+        """
+        fixers = [
+            fixer for fixer in self.fixers
+            if fixer.TRIGGER is None or fixer.TRIGGER in source
+        ]
+        if not fixers:
+            return source
+        # Like lib2to3, add a newline to the end of the source and remove the
+        # last character of the result. It makes a difference when the source
+        # doesn't end with a newline or when its last statement is removed.
+        source += '\n'
+        tokens = generate_tokens(source)
+        edits = []
+        for fixer in fixers:
+            edits.extend(fixer.get_edits(source, tokens))
+        return apply_edits(source, edits)[:-1]
+
+
+def apply_edits(source, edits):
+    """Return *source* with *edits* applied.
+
+    Raise ValueError if the edits overlap.
+    """
+    if not edits:
+        return source
+    edits = sorted(edits)
+    parts = []
+    position = 0
+    for edit in edits:
+        if edit.start < position:
+            raise ValueError('overlapping edits: %r' % (edits,))
+        parts.append(source[position:edit.start])
+        parts.append(edit.text)
+        position = edit.end
+    parts.append(source[position:])
+    # Keep the type of *source*.
+    return source[:0].join(parts)
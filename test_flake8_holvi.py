@@ -1,16 +1,63 @@
 # coding: utf-8
 from __future__ import print_function
 
+import argparse
 import ast
+import io
+import json
+import os
+import shutil
+import subprocess
 import sys
+import tempfile
 import textwrap
+import threading
+import time
 import unittest
+import warnings
 
+import bench_flake8_holvi
+import bench_holvi_lib2to3
+from holvi_lib2to3 import main as lib2to3_driver
+from holvi_lib2to3 import rewrite
 from flake8_holvi import HolviChecker
 from flake8_holvi import HolviVisitor
+from flake8_holvi import InotifyWatcher
+from flake8_holvi import LintServer
+from flake8_holvi import ModuleIndex
+from flake8_holvi import PollingWatcher
+from flake8_holvi import ProjectIndex
+from flake8_holvi import ResultCache
+from flake8_holvi import build_noqa_map
+from flake8_holvi import SourcePrefilter
+from flake8_holvi import StatsRecorder
+from flake8_holvi import StatsVisitor
+from flake8_holvi import _statement_ranges
+from flake8_holvi import check_file
+from flake8_holvi import check_files
+from flake8_holvi import check_sources
+from flake8_holvi import collect_string_literals
+from flake8_holvi import discover_files
+from flake8_holvi import fix_files
+from flake8_holvi import fix_source
+from flake8_holvi import get_changed_lines
+from flake8_holvi import get_enabled_codes
+from flake8_holvi import lines_overlap
+from flake8_holvi import main
+from flake8_holvi import parse_diff
+from flake8_holvi import parse_source
+from flake8_holvi import query_server
 
 PY3 = sys.version_info[0] == 3
 
+with warnings.catch_warnings():
+    # lib2to3 is deprecated and it was removed in Python 3.13.
+    warnings.simplefilter('ignore')
+    try:
+        from lib2to3 import refactor as lib2to3_refactor
+    except ImportError:
+        lib2to3_refactor = None
+
 
 class BaseTestCase(unittest.TestCase):
 
@@ -27,6 +74,11 @@ class BaseTestCase(unittest.TestCase):
         visitor = HolviVisitor()
         visitor.visit(tree)
         found_violations = visitor.violation_codes
+        # Checks enabled by the prefilter must find the same violations.
+        codes = SourcePrefilter(HolviVisitor.rules).live_rules(source)
+        prefiltered_visitor = HolviVisitor(enabled_codes=codes)
+        prefiltered_visitor.visit(tree)
+        self.assertEqual(prefiltered_visitor.violation_codes, found_violations)
         if self.print_violations:
             print()
             print(found_violations)
@@ -144,6 +196,63 @@ class HolviVisitorErrorsTestCase(BaseTestCase):
         """
         self.assertSourceViolates(source)
 
+    def test_late_binding_nested_loops(self):
+        source = """
+        for user in users:
+            for event in user.events:
+                pass
+            transaction.on_commit(lambda: task.apply_async((user.id,)))
+            for event in user.events:
+                transaction.on_commit(lambda: task.apply_async(user.id, event_id=event.id))
+        """
+        self.assertSourceViolates(source, ['HLVE008', 'HLVE008', 'HLVE008'])
+
+    def test_late_binding_tuple_target(self):
+        source = """
+        for index, (event, user) in enumerate(pairs):
+            transaction.on_commit(lambda user=user: task.apply_async((event.id, user.id)))
+        """
+        self.assertSourceViolates(source, ['HLVE012'])
+
+    def test_late_binding_comprehension(self):
+        source = """
+        callbacks = [lambda: task.apply_async(event.id) for event in events]
+        """
+        self.assertSourceViolates(source, ['HLVE008'])
+
+    def test_late_no_error_4(self):
+        source = """
+        for event in events:
+            transaction.on_commit(lambda *event: task.apply_async(event))
+            transaction.on_commit(lambda: task.apply_async([event.id for event in others]))
+        task.apply_async(lambda: task.delay(event.id))
+        """
+        self.assertSourceViolates(source)
+
+    def test_late_binding_nested_lambda(self):
+        source = """
+        for event in events:
+            transaction.on_commit(lambda: task.apply_async(lambda event: event.id))
+            transaction.on_commit(lambda: task.apply_async(lambda: event.id))
+        """
+        self.assertSourceViolates(source, ['HLVE008'])
+
+    def test_late_no_error_function_scope(self):
+        source = """
+        for event in events:
+            def get_callback(event):
+                return lambda: task.apply_async(event.id)
+        """
+        self.assertSourceViolates(source)
+
+    def test_late_no_error_loop_iterable(self):
+        source = """
+        for event in map(lambda: task.apply_async(event.id), events):
+            pass
+        callbacks = [callback for event in map(lambda: task.delay(event), events)]
+        """
+        self.assertSourceViolates(source)
+
     def test_python2_imports(self):
         source = """
         import urlparse
@@ -402,8 +511,18 @@ class HLVE312TestCase(BaseTestCase):
         """
         self.assertSourceViolates(source)
 
+    def test_assertin_nested_block(self):
+        source = """
+        class FooTestCase(unittest.TestCase):
+            def test_get(self):
+                for url in urls:
+                    expected = u'test string'
+                    response = self.client.get(url)
+                    self.assertIn(expected, response.content)
+        """
+        self.assertSourceViolates(source, ['HLVE312'])
+
 
-@unittest.skipIf(PY3, reason='needs Python 2')
 class HLVE313TestCase(BaseTestCase):
 
     def test_variable(self):
@@ -481,6 +600,42 @@ class HLVE313TestCase(BaseTestCase):
         """
         self.assertSourceViolates(source, ['HLVE313'])
 
+    def test_import_as(self):
+        source = """
+        from django.core.exceptions import ValidationError as DjangoValidationError
+        from rest_framework.exceptions import ValidationError
+
+        try:
+            raise DjangoValidationError('foo')
+        except DjangoValidationError as exc:
+            message = exc.message
+        try:
+            raise ValidationError('foo')
+        except ValidationError as exc:
+            message = exc.message
+        """
+        self.assertSourceViolates(source, ['HLVE313'])
+
+    def test_import_of_several_names(self):
+        source = """
+        from django.core.exceptions import PermissionDenied, ValidationError
+
+        try:
+            raise ValidationError('foo')
+        except ValidationError as exc:
+            message = exc.message
+        """
+        self.assertSourceViolates(source)
+
+    def test_self(self):
+        source = """
+        try:
+            1/0
+        except Exception as self:
+            message = self.message
+        """
+        self.assertSourceViolates(source)
+
     def test_exception_as_attribute(self):
         source = """
         try:
@@ -531,6 +686,15 @@ class HLVE314TestCase(BaseTestCase):
         """
         self.assertSourceViolates(source, ['HLVE314'])
 
+    def test_self_and_loggers(self):
+        # Methods of these objects aren't dict methods.
+        source = """
+        self.iteritems()
+        logger.iterkeys()
+        logging.itervalues()
+        """
+        self.assertSourceViolates(source)
+
     def test_six_iteritems(self):
         source = """
         import six
@@ -611,6 +775,18 @@ class HLVE010TestCase(BaseTestCase):
         """
         self.assertSourceViolates(source)
 
+    def test_after_except_block(self):
+        source = """
+        import logging
+
+        try:
+            1/0
+        except Exception:
+            pass
+        logging.exception('foo')
+        """
+        self.assertSourceViolates(source, ['HLVE010'])
+
 
 class HolviCheckerTestCase(BaseTestCase):
 
@@ -645,3 +821,1244 @@ class HolviCheckerTestCase(BaseTestCase):
         logging.info('some {}'.format(stuff))  # noqa
         """
         self.assertRunPlugin(source, ['HLVE302'])
+
+    def test_skip_noqa_codes(self):
+        source = """
+        stuff = str(unicode(stuff))  # noqa: HLVE303
+        stuff = str(unicode(stuff))  # NOQA:HLVE303,HLVE302
+        stuff = str(unicode(stuff))  # noqa: HLVE3
+        """
+        self.assertRunPlugin(source, ['HLVE302'])
+
+    def test_noqa_in_string(self):
+        source = """
+        stuff = unicode('# noqa')
+        """
+        self.assertRunPlugin(source, ['HLVE302', 'HLVW301'])
+
+    def test_skip_file(self):
+        source = """
+        # flake8: noqa
+        stuff = unicode(stuff)
+        """
+        lines = textwrap.dedent(source).splitlines(True)
+        plugin = HolviChecker(ast.parse(''.join(lines)), None, lines)
+        self.assertEqual(list(plugin.run()), [])
+
+        source = """
+        # flake8: noqa: HLVE302
+        stuff = unicode(stuff)
+        """
+        self.assertRunPlugin(source, ['HLVE302'])
+
+    def test_reuse_tree(self):
+        lines = ['foo = unicode(bar)\n', '\n']
+        # The tree passed by flake8 must be used as is.
+        tree = ast.parse('foo = 42\nfoo = unicode(bar)\n')
+        plugin = HolviChecker(tree, None, lines)
+        self.assertEqual([v[0] for v in plugin.run()], [2])
+
+    def test_parse_lines_without_tree(self):
+        lines = ['foo = unicode(bar)\n']
+        plugin = HolviChecker(None, None, lines)
+        codes = [v[2].split()[0] for v in plugin.run()]
+        self.assertEqual(codes, ['HLVE302'])
+
+
+class ParseSourceTestCase(unittest.TestCase):
+
+    def test_cache(self):
+        source = 'foo = unicode(bar)\n'
+        self.assertIs(parse_source(source), parse_source(source))
+        self.assertIsNot(parse_source(source), parse_source(source + '\n'))
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_get_and_set(self):
+        cache = ResultCache(self.directory)
+        key = cache.make_key('foo = unicode(bar)\n', {'ignore_warnings': False})
+        self.assertNotEqual(key, cache.make_key('foo = unicode(bar)\n', {'ignore_warnings': True}))
+        self.assertIsNone(cache.get(key))
+        cache.set(key, [[1, 6, 'HLVE302 message']])
+        self.assertEqual(cache.get(key), [[1, 6, 'HLVE302 message']])
+
+    def test_prune(self):
+        cache = ResultCache(self.directory, max_entries=10)
+        for i in range(11):
+            cache.set('key%d' % i, [])
+        self.assertEqual(len(os.listdir(self.directory)), 9)
+
+    def test_prune_interval(self):
+        cache = ResultCache(self.directory, max_entries=100)
+        prune = cache.prune
+        calls = []
+
+        def counting_prune():
+            calls.append(cache._writes)
+            prune()
+
+        cache.prune = counting_prune
+        for i in range(100):
+            cache.set('key%d' % i, [])
+        # The directory is listed on the first write and every ten writes.
+        self.assertEqual(calls, [1] + [10] * 9)
+        for i in range(100, 120):
+            cache.set('key%d' % i, [])
+        self.assertLessEqual(len(os.listdir(self.directory)), 100)
+
+    def test_checker(self):
+        HolviChecker.cache = ResultCache(self.directory)
+        self.addCleanup(setattr, HolviChecker, 'cache', None)
+        lines = ['foo = unicode(bar)  # noqa\n', 'bar = unicode(foo)\n']
+        expected = list(HolviChecker(ast.parse(''.join(lines)), None, lines).run())
+        self.assertEqual(len(expected), 1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        # The tree must not be needed for a cache hit.
+        found = list(HolviChecker(None, None, lines).run())
+        self.assertEqual([v[:3] for v in found], [tuple(v[:3]) for v in expected])
+
+
+class DiffTestCase(unittest.TestCase):
+
+    diff = textwrap.dedent("""\
+    diff --git a/spam.py b/spam.py
+    index 1234567..89abcde 100644
+    --- a/spam.py
+    +++ b/spam.py
+    @@ -3 +3 @@ import os
+    -foo = 1
+    +foo = 2
+    @@ -10,2 +9,0 @@ def eggs():
+    -    pass
+    -    pass
+    @@ -20,0 +19,3 @@ def eggs():
+    +bar = 1
+    +bar = 2
+    +bar = 3
+    diff --git a/removed.py b/removed.py
+    deleted file mode 100644
+    --- a/removed.py
+    +++ /dev/null
+    @@ -1 +0,0 @@
+    -foo = 1
+    diff --git "a/caf\\303\\251 \\"1\\".py" "b/caf\\303\\251 \\"1\\".py"
+    --- "a/caf\\303\\251 \\"1\\".py"
+    +++ "b/caf\\303\\251 \\"1\\".py"
+    @@ -1 +1 @@
+    -foo = 1
+    +foo = 2
+    """)
+
+    def test_parse_diff(self):
+        root = os.path.abspath('repo')
+        self.assertEqual(parse_diff(self.diff, root), {
+            os.path.join(root, 'spam.py'): [(3, 3), (9, 9), (19, 21)],
+            os.path.join(root, u'caf\u00e9 "1".py'): [(1, 1)],
+        })
+
+    def test_get_changed_lines(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'spam.py')
+
+        def git(*args):
+            subprocess.check_output(
+                ('git', '-c', 'user.name=test', '-c', 'user.email=test@example.com') + args,
+                cwd=directory, stderr=subprocess.STDOUT,
+            )
+
+        git('init', '-q')
+        # Configuration that changes the paths in the headers of 'git diff'.
+        git('config', 'diff.mnemonicPrefix', 'true')
+        git('config', 'diff.noprefix', 'true')
+        with open(path, 'w') as f:
+            f.write(''.join('line%d = %d\n' % (i, i) for i in range(1, 11)))
+        git('add', 'spam.py')
+        git('commit', '-q', '-m', 'Add spam.py')
+        with open(path, 'w') as f:
+            # Remove lines 1, 5 and 6.
+            f.write(''.join('line%d = %d\n' % (i, i) for i in range(2, 11) if i not in (5, 6)))
+        changed_lines = get_changed_lines('HEAD', cwd=directory)
+        self.assertEqual(list(changed_lines.values()), [[(1, 1), (3, 3)]])
+        self.assertEqual(os.path.basename(list(changed_lines)[0]), 'spam.py')
+        git('config', '--unset', 'diff.noprefix')
+        changed_lines = get_changed_lines('HEAD', cwd=directory)
+        self.assertEqual(list(changed_lines), [os.path.realpath(path)])
+
+    def test_lines_overlap(self):
+        ranges = [(3, 3), (10, 10), (19, 21)]
+        self.assertTrue(lines_overlap(ranges, 1, 3))
+        self.assertTrue(lines_overlap(ranges, 20, 20))
+        self.assertTrue(lines_overlap(ranges, 21, 100))
+        self.assertFalse(lines_overlap(ranges, 4, 9))
+        self.assertFalse(lines_overlap(ranges, 22, 100))
+        self.assertFalse(lines_overlap([], 1, 1))
+
+    def test_checker(self):
+        source = textwrap.dedent("""\
+        from django.core.exceptions import ValidationError
+
+        foo = unicode(bar)
+
+
+        def spam():
+            eggs = unicode(bar)
+            return str(eggs)
+        """)
+        lines = source.splitlines(True)
+        filename = os.path.abspath('spam.py')
+        HolviChecker.changed_lines = {filename: [(8, 8)]}
+        self.addCleanup(setattr, HolviChecker, 'changed_lines', None)
+        plugin = HolviChecker(ast.parse(source), filename, lines)
+        self.assertEqual([v[:2] for v in plugin.run()], [(8, 11)])
+        plugin = HolviChecker(ast.parse(source), os.path.abspath('other.py'), lines)
+        self.assertEqual(list(plugin.run()), [])
+
+    def test_visit_changed(self):
+        source = textwrap.dedent("""\
+        from django.core.exceptions import ValidationError
+
+        foo = unicode(bar)
+
+        @decorator
+        def spam():
+            eggs = unicode(bar)
+        """)
+        visitor = HolviVisitor()
+        visitor.visit_changed(ast.parse(source), [(5, 5)])
+        self.assertEqual(visitor.violation_codes, ['HLVE302'])
+        self.assertEqual(visitor.violations[0].lineno, 7)
+        self.assertEqual(
+            visitor.import_from_nodes,
+            [('django.core.exceptions', 'ValidationError', 'ValidationError')],
+        )
+
+
+class RunnerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for path, source in (
+            ('a.py', 'foo = unicode(bar)\n'),
+            ('b.py', 'foo = 42\n'),
+            ('README.md', 'unicode()\n'),
+            ('pkg/c.py', 'foo = (\n'),
+            ('.git/d.py', 'foo = unicode(bar)\n'),
+        ):
+            path = os.path.join(self.directory, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(source)
+
+    def test_discover_files(self):
+        self.assertEqual(discover_files([self.directory]), [
+            os.path.join(self.directory, 'a.py'),
+            os.path.join(self.directory, 'b.py'),
+            os.path.join(self.directory, 'pkg', 'c.py'),
+        ])
+
+    def test_check_files(self):
+        paths = discover_files([self.directory])
+        expected = list(check_files(paths, jobs=1))
+        self.assertEqual([p for p, _ in expected], paths)
+        self.assertEqual([v[2].split()[0] for v in expected[0][1]], ['HLVE302'])
+        self.assertEqual(expected[1][1], [])
+        self.assertEqual([v[2].split()[0] for v in expected[2][1]], ['E999'])
+        self.assertEqual(list(check_files(paths, jobs=2)), expected)
+
+    def test_check_sources(self):
+        sources = (
+            ('a.py', 'foo = unicode(bar)\n'),
+            ('missing.py', ''),
+            ('b.py', 'foo = (\n'),
+        )
+        expected = list(check_sources(iter(sources)))
+        self.assertEqual([name for name, _ in expected], ['a.py', 'missing.py', 'b.py'])
+        self.assertEqual([v[:2] + (v[2].split()[0],) for v in expected[0][1]], [(1, 7, 'HLVE302')])
+        self.assertEqual(expected[1][1], [])
+        self.assertEqual([v[2].split()[0] for v in expected[2][1]], ['E999'])
+        self.assertEqual(list(check_sources(iter(sources), jobs=2)), expected)
+
+    def test_check_sources_lazily(self):
+        consumed = []
+
+        def sources():
+            for i in range(1000):
+                consumed.append(i)
+                yield 'module_%d.py' % i, 'foo = %d\n' % i
+
+        results = check_sources(sources(), jobs=2)
+        self.assertEqual(next(results), ('module_0.py', []))
+        # Two chunks of four sources per job are read ahead.
+        self.assertEqual(len(consumed), 16)
+        results.close()
+
+    def test_main_exit_code(self):
+        self.assertEqual(main(['-j', '1', os.path.join(self.directory, 'b.py')]), 0)
+        self.assertEqual(main(['-j', '1', '--exit-zero', self.directory]), 0)
+        self.assertEqual(main(['-j', '1', self.directory]), 1)
+
+
+class RelativeImportsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for path in ('pkg/__init__.py', 'pkg/billing.py', 'pkg/sub/__init__.py', 'pkg/data/x.txt'):
+            path = os.path.join(self.directory, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write('')
+        self.path = os.path.join(self.directory, 'pkg', 'views.py')
+        with open(self.path, 'w') as f:
+            f.write('from billing import Invoice\nfrom models import User\nfrom sub import x\n')
+        for name in ('relative_imports', 'extra_relative_imports', 'module_index'):
+            self.addCleanup(setattr, HolviChecker, name, getattr(HolviChecker, name))
+
+    def check(self, *args):
+        main(['-j', '1', '--exit-zero'] + list(args) + [self.path])
+        return [(row, text.split()[0]) for row, _, text in check_file(self.path)]
+
+    def test_module_index(self):
+        index = ModuleIndex()
+        package = os.path.join(self.directory, 'pkg')
+        self.assertEqual(index.get_modules(package), {'billing', 'sub', 'views'})
+        self.assertEqual(index.get_modules(self.directory), set())
+        index.index_files([self.path, os.path.join(package, 'sub', 'y.py')])
+        self.assertEqual(
+            sorted(index.modules),
+            [self.directory, package, os.path.join(package, 'sub')],
+        )
+
+    def test_options(self):
+        # Line 1 imports billing, 2 models and 3 sub.
+        self.assertEqual(self.check(), [(2, 'HLVE311')])
+        self.assertEqual(
+            self.check('--holvi-relative-imports', 'billing, payments'),
+            [(1, 'HLVE311'), (2, 'HLVE311')],
+        )
+        self.assertEqual(
+            self.check('--holvi-discover-relative-imports'),
+            [(1, 'HLVE311'), (3, 'HLVE311')],
+        )
+        self.assertEqual(
+            self.check('--holvi-discover-relative-imports', '--holvi-relative-imports', 'models'),
+            [(1, 'HLVE311'), (2, 'HLVE311'), (3, 'HLVE311')],
+        )
+
+
+class ProjectIndexTestCase(unittest.TestCase):
+
+    files = {
+        'pkg/__init__.py': '',
+        'pkg/errors.py': (
+            'from django.core.exceptions import ValidationError as DjangoValidationError\n'
+            'class PaymentError(DjangoValidationError):\n'
+            '    pass\n'
+            'class RefundError(PaymentError, object):\n'
+            '    pass\n'
+            'class OtherError(Exception):\n'
+            '    pass\n'
+        ),
+        'pkg/sub/__init__.py': 'from ..errors import RefundError\nclass SubError(RefundError):\n    pass\n',
+        'pkg/views.py': (
+            'from .errors import OtherError, RefundError as Refund\n'
+            'from pkg.sub import SubError\n'
+            'try:\n'
+            '    pass\n'
+            'except Refund as exc:\n'
+            '    exc.message\n'
+            'except SubError as exc:\n'
+            '    exc.message\n'
+            'except OtherError as exc:\n'
+            '    exc.message\n'
+        ),
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for path, source in self.files.items():
+            path = os.path.join(self.directory, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(source)
+        self.package = os.path.join(self.directory, 'pkg')
+        self.index = ProjectIndex.build(
+            [self.directory], os.path.join(self.directory, 'index.txt'),
+        )
+        for name in ('module_index', 'project_index'):
+            self.addCleanup(setattr, HolviChecker, name, getattr(HolviChecker, name))
+
+    def test_modules(self):
+        self.assertEqual(self.index.get_modules(self.package), {'errors', 'sub', 'views'})
+        self.assertEqual(self.index.get_modules(os.path.join(self.package, 'sub')), set())
+        # Directories that weren't indexed are listed.
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        with open(os.path.join(other, '__init__.py'), 'w') as f:
+            f.write('')
+        self.assertEqual(self.index.get_modules(other), set())
+
+    def test_message_exceptions(self):
+        for name in ('PaymentError', 'RefundError'):
+            self.assertTrue(self.index.is_message_exception('pkg.errors', name))
+        self.assertTrue(self.index.is_message_exception('pkg.sub', 'SubError'))
+        self.assertFalse(self.index.is_message_exception('pkg.errors', 'OtherError'))
+        self.assertFalse(self.index.is_message_exception('pkg', 'RefundError'))
+        exceptions = self.index.get_message_exceptions(os.path.join(self.package, 'views.py'))
+        self.assertIn(('.errors', 'RefundError'), exceptions)
+        self.assertIn(('..pkg.errors', 'RefundError'), exceptions)
+        self.assertIn(('django.core.exceptions', 'ValidationError'), exceptions)
+        self.assertNotIn(('.errors', 'OtherError'), exceptions)
+        self.assertNotIn(('...errors', 'RefundError'), exceptions)
+
+    def test_pickle(self):
+        import pickle
+
+        index = pickle.loads(pickle.dumps(self.index))
+        self.assertEqual(index.path, self.index.path)
+        self.assertTrue(index.is_message_exception('pkg.errors', 'RefundError'))
+        self.assertEqual(
+            index.get_message_exception_classes(), self.index.get_message_exception_classes(),
+        )
+
+    def test_cache_settings(self):
+        path = os.path.join(self.package, 'views.py')
+        HolviChecker.project_index = self.index
+
+        def get_settings():
+            with open(path) as f:
+                lines = f.readlines()
+            return HolviChecker(None, path, lines).get_cache_settings()
+
+        settings = get_settings()
+        self.assertEqual(settings['project_index'], {
+            'package': 'pkg',
+            'message_exceptions': [['pkg.errors', 'RefundError'], ['pkg.sub', 'SubError']],
+        })
+        # Exceptions that the file doesn't mention don't change the key.
+        with open(os.path.join(self.package, 'other.py'), 'w') as f:
+            f.write('from .errors import PaymentError\nclass NewError(PaymentError):\n    pass\n')
+        HolviChecker.project_index = ProjectIndex.build(
+            [self.directory], os.path.join(self.directory, 'index2.txt'),
+        )
+        self.assertEqual(get_settings()['project_index'], settings['project_index'])
+        # Exceptions that it does mention do.
+        with open(os.path.join(self.package, 'errors.py'), 'a') as f:
+            f.write('class OtherError(PaymentError):\n    pass\n')
+        HolviChecker.project_index = ProjectIndex.build(
+            [self.directory], os.path.join(self.directory, 'index3.txt'),
+        )
+        self.assertIn(['pkg.errors', 'OtherError'], get_settings()['project_index']['message_exceptions'])
+
+    def test_option(self):
+        path = os.path.join(self.package, 'views.py')
+        self.addCleanup(os.environ.pop, 'HOLVI_PROJECT_INDEX', None)
+        main(['-j', '1', '--exit-zero', '--holvi-project-index', self.directory])
+        self.assertIsNotNone(HolviChecker.project_index)
+        self.assertEqual([row for row, _, _ in check_file(path)], [10])
+        HolviChecker.parse_options(argparse.Namespace())
+        self.assertEqual([row for row, _, _ in check_file(path)], [6, 8, 10])
+
+
+class FixTestCase(unittest.TestCase):
+
+    source = (
+        '"""Docstring."""\n'
+        'from __future__ import unicode_literals\n'
+        '\n'
+        'import urlparse\n'
+        'import cPickle as pickle\n'
+        'from httplib import HTTPConnection\n'
+        'import os, Queue\n'
+        '\n'
+        '\n'
+        'class Tests(TestCase):\n'
+        '    def test_fix(self):\n'
+        u'        s = u"\u00e4"; self.assertEquals(s, 1)\n'
+        '        self.assertListEqual(a, b)  # noqa: HLVE014\n'
+        '        self.assertDictEqual(a, b)\n'
+        '        self.assertItemsEqual(\n'
+        '            a, b)\n'
+        '        self.assertRaisesRegexp()\n'
+        '        for k, v in data.iteritems():\n'
+        '            x = foo(y.iterkeys()).bar.itervalues()\n'
+    )
+
+    expected = (
+        '"""Docstring."""\n'
+        'from __future__ import unicode_literals\n'
+        '\n'
+        'import six\n'
+        'from six.moves.urllib import parse as urlparse\n'
+        'from six.moves import cPickle as pickle\n'
+        'from six.moves.http_client import HTTPConnection\n'
+        'import os, Queue\n'
+        '\n'
+        '\n'
+        'class Tests(TestCase):\n'
+        '    def test_fix(self):\n'
+        u'        s = u"\u00e4"; self.assertEqual(s, 1)\n'
+        '        self.assertListEqual(a, b)  # noqa: HLVE014\n'
+        '        self.assertEqual(a, b)\n'
+        '        six.assertCountEqual(self,\n'
+        '            a, b)\n'
+        '        six.assertRaisesRegex(self)\n'
+        '        for k, v in six.iteritems(data):\n'
+        '            x = six.itervalues(foo(six.iterkeys(y)).bar)\n'
+    )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'tests.py')
+
+    def fix(self, source):
+        if isinstance(source, bytes):
+            # Python 2.
+            source = source.decode('utf-8')
+        with io.open(self.path, 'w', encoding='utf-8', newline='') as f:
+            f.write(source)
+        result = list(fix_files([self.path]))[0][1]
+        with io.open(self.path, encoding='utf-8') as f:
+            return result, f.read()
+
+    def test_fix_file(self):
+        self.assertEqual(self.fix(self.source), ((10, None), self.expected))
+        self.assertEqual(self.fix(self.expected), ((0, None), self.expected))
+        self.assertEqual(
+            [text.split()[0] for _, _, text in check_file(self.path)],
+            ['HLVE309'],
+        )
+
+    def test_encoding_declaration(self):
+        source = (
+            u'# coding: latin-1\n'
+            u'class Tests(TestCase):\n'
+            u'    def test_fix(self):\n'
+            u'        s = u"\u00e4"; self.assertEquals(s, 1)\n'
+        )
+        with io.open(self.path, 'w', encoding='latin-1') as f:
+            f.write(source)
+        self.assertEqual(list(fix_files([self.path]))[0][1], (1, None))
+        with io.open(self.path, encoding='latin-1') as f:
+            self.assertEqual(f.read(), source.replace(u'assertEquals', u'assertEqual'))
+
+    def test_fix_source(self):
+        source = 'import six\nd.iteritems()\nfrom . import urlparse\n'
+        tree = ast.parse(source)
+        visitor = HolviVisitor()
+        visitor.visit(tree)
+        new_source, fixed, changed_lines = fix_source(source, tree, visitor.violations)
+        self.assertEqual(new_source, 'import six\nsix.iteritems(d)\nfrom . import urlparse\n')
+        self.assertEqual([v.code for v in fixed], ['HLVE314'])
+        self.assertEqual(changed_lines, [(2, 2)])
+
+    def test_existing_six_binding(self):
+        for imports in (
+            'from django.utils import six\n',
+            'from ..packages import six\n',
+            'import six.moves\n',
+            'try:\n    import six\nexcept ImportError:\n    from .vendor import six\n',
+            'if PY2:\n    pass\nelse:\n    from .vendor import six\n',
+        ):
+            source = imports + 'd.iteritems()\n'
+            tree = ast.parse(source)
+            visitor = HolviVisitor()
+            visitor.visit(tree)
+            new_source, _, _ = fix_source(source, tree, visitor.violations)
+            self.assertEqual(new_source, imports + 'six.iteritems(d)\n')
+        # Imports in functions don't bind the module-level name.
+        source = 'import os\ndef f():\n    import six\nd.iteritems()\n'
+        tree = ast.parse(source)
+        visitor = HolviVisitor()
+        visitor.visit(tree)
+        new_source, _, _ = fix_source(source, tree, visitor.violations)
+        self.assertEqual(
+            new_source, 'import six\n' + source.replace('d.iteritems()', 'six.iteritems(d)'),
+        )
+
+    def test_unchanged(self):
+        for source in (
+            'foo = 42\n',
+            'foo = (\n',
+            '"""Docstring."""; d.iteritems()\n',
+            # six.moves.cStringIO isn't a module.
+            'import cStringIO\nf = cStringIO.StringIO()\n',
+            'from cStringIO import StringIO\n',
+        ):
+            self.assertEqual(self.fix(source), ((0, None), source))
+
+
+class LintServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'a.py')
+        self.write(self.path, 'foo = unicode(bar)\n')
+
+    def write(self, path, source):
+        with open(path, 'w') as f:
+            f.write(source)
+
+    def wait_for(self, predicate):
+        deadline = time.time() + 5
+        while not predicate():
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+    def test_check(self):
+        server = LintServer(os.path.join(self.directory, 'socket'), max_entries=1)
+        self.assertEqual([v[2].split()[0] for v in server.check(self.path)], ['HLVE302'])
+        self.assertIs(server.check(self.path), server.entries[self.path][1])
+        self.write(self.path, 'foo = str(bar)\n')
+        self.assertEqual([v[2].split()[0] for v in server.check(self.path)], ['HLVE303'])
+        other = os.path.join(self.directory, 'b.py')
+        self.write(other, 'foo = 42\n')
+        self.assertEqual(server.check(other), [])
+        self.assertEqual(list(server.entries), [other])
+        # Relative paths share the entry of the absolute path.
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory)
+        self.assertIs(server.check('b.py'), server.entries[other][1])
+        self.assertEqual(list(server.entries), [other])
+
+    def test_serve(self):
+        socket_path = os.path.join(self.directory, 'socket')
+        watcher = PollingWatcher([self.directory], interval=0.01)
+        server = LintServer(socket_path, watcher=watcher)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        self.wait_for(lambda: os.path.exists(socket_path))
+        output = query_server(socket_path, [self.path])
+        self.assertEqual(len(output), 1)
+        self.assertTrue(output[0].startswith(self.path + ':1:7: HLVE302 '))
+        # The watcher re-checks changed files in the background.
+        other = os.path.join(self.directory, 'b.py')
+        self.write(other, 'foo = str(bar)\n')
+        self.wait_for(lambda: other in server.entries)
+        self.assertEqual(query_server(socket_path, [other])[0].split()[1], 'HLVE303')
+
+    def test_serve_relative_root(self):
+        socket_path = os.path.join(self.directory, 'socket')
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory)
+        server = LintServer(socket_path, watcher=PollingWatcher(['.'], interval=0.01))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        self.wait_for(lambda: os.path.exists(socket_path))
+        # Files saved under a relative root are cached by their absolute path,
+        # so clients asking for the absolute path get the background result.
+        path = os.path.join(os.getcwd(), 'b.py')
+        # Rename the file into place so that it isn't seen half-written.
+        self.write('b.tmp', 'foo = str(bar)\n')
+        os.rename('b.tmp', 'b.py')
+        self.wait_for(lambda: path in server.entries)
+        self.assertEqual(list(server.entries), [path])
+        entry = server.entries[path]
+        self.assertEqual(query_server(socket_path, [path])[0].split()[1], 'HLVE303')
+        self.assertIs(server.entries[path], entry)
+
+    def test_inotify_watcher(self):
+        try:
+            watcher = InotifyWatcher([self.directory], interval=1)
+        except OSError:
+            self.skipTest('inotify is not available')
+        self.addCleanup(watcher.close)
+        self.write(self.path, 'foo = 42\n')
+        os.mkdir(os.path.join(self.directory, 'pkg'))
+        self.assertEqual(watcher.wait(), [self.path])
+        path = os.path.join(self.directory, 'pkg', 'b.py')
+        self.write(path, '')
+        self.assertEqual(watcher.wait(), [path])
+
+
+class ImportTimeTestCase(unittest.TestCase):
+
+    # flake8 imports the plugin in every worker process, so modules that
+    # only some options need are imported when they are used. Checking
+    # sys.modules doesn't depend on the load of the machine like timing the
+    # import would.
+    lazy_modules = (
+        'argparse', 'ctypes', 'hashlib', 'json', 'mmap', 'multiprocessing', 'pycodestyle',
+        'select', 'socket', 'subprocess', 'tempfile', 'threading',
+    )
+    code = (
+        'import sys\n'
+        'import flake8_holvi\n'
+        'print(",".join(sorted(m for m in %r if m in sys.modules)))\n'
+    ) % (lazy_modules,)
+
+    def test_lazy_imports(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c', self.code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        self.assertEqual(output.decode('ascii').strip(), '')
+
+
+class Lib2to3DriverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.sources = {
+            'a.py': 'from __future__ import unicode_literals\n\nimport os\n',
+            'b.py': 'import os\n',
+            'c.py': '"""Mentions __future__."""\n',
+            '.d.py': 'from __future__ import unicode_literals\n',
+        }
+        for name, source in self.sources.items():
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write(source)
+        self.cache = os.path.join(self.directory, 'cache.json')
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name)) as f:
+            return f.read()
+
+    def test_main(self):
+        args = ['-j', '2', '--no-diffs', '--cache', self.cache, self.directory]
+        self.assertEqual(lib2to3_driver.main(args), 0)
+        self.assertEqual(self.read('a.py'), self.sources['a.py'])
+        # Only c.py contains the trigger and needs no changes.
+        record = lib2to3_driver.FileRecord(self.cache, ['future'])
+        self.assertEqual(record.hashes, {record.digest(self.sources['c.py'].encode('ascii'))})
+        # Files are checked again by other versions.
+        self.addCleanup(setattr, lib2to3_driver, '__version__', lib2to3_driver.__version__)
+        lib2to3_driver.__version__ = '0.0.1'
+        other = lib2to3_driver.FileRecord(self.cache, ['future'])
+        self.assertNotIn(other.digest(self.sources['c.py'].encode('ascii')), other)
+
+        self.assertEqual(lib2to3_driver.main(['-w', '-n', '-j', '1', self.directory]), 0)
+        self.assertEqual(self.read('a.py'), 'import os\n')
+        self.assertEqual(self.read('.d.py'), self.sources['.d.py'])
+
+    def test_fixer_names(self):
+        self.assertEqual(lib2to3_driver.get_fixer_names(), ['future'])
+        self.assertEqual(lib2to3_driver.get_fixer_names(['all'], ['future']), [])
+        self.assertRaises(ValueError, lib2to3_driver.get_fixer_names, ['spam'])
+        self.assertEqual(lib2to3_driver.get_triggers(['future']), [b'__future__'])
+
+
+class RewriteTestCase(unittest.TestCase):
+
+    cases = [
+        (
+            'from __future__ import unicode_literals\n\nimport os\n',
+            'import os\n',
+        ),
+        (
+            '# coding: utf-8\n"""Doc."""\n\nfrom __future__ import a  # Comment\n'
+            '# Another comment\nfrom __future__ import b, \\\n    c\n\n\nimport os\n',
+            '# coding: utf-8\n"""Doc."""\n\n# Another comment\nimport os\n',
+        ),
+        # Like in lib2to3, the trailing newline is removed with the last statement.
+        ('import os\nfrom __future__ import a\n', 'import os'),
+        ('from __future__ import a; import os\n', None),
+        ('from __future__ import (a,\n    b)\n', None),
+        ('import os\n', None),
+        ('', None),
+        # Like in lib2to3, imports that end with CRLF are kept.
+        ('from __future__ import a\r\n\r\nimport os\r\n', None),
+        ('if x:\r\n    pass\r\nfrom __future__ import a\r\n', None),
+        ('from __future__ import a\n\r\nimport os\r\n', 'import os\r\n'),
+        # Tab and form feed indentation and whitespace.
+        ('if x:\n\tpass\nfrom __future__ import a\n\nimport os\n', 'if x:\n\tpass\nimport os\n'),
+        ('if x:\n\x0c    pass\nfrom __future__ import a\n', 'if x:\n\x0c    pass'),
+        ('\x0cfrom __future__ import a\n\x0c\nimport os\n', '\x0cimport os\n'),
+    ]
+
+    def test_fix_future(self):
+        rewriter = rewrite.Rewriter([rewrite.FixFuture()])
+        for source, expected in self.cases:
+            self.assertEqual(rewriter.refactor(source), source if expected is None else expected)
+
+    @unittest.skipIf(lib2to3_refactor is None, reason='needs lib2to3')
+    def test_same_as_lib2to3(self):
+        rewriter = rewrite.Rewriter([rewrite.FixFuture()])
+        tool = lib2to3_refactor.RefactoringTool(['holvi_lib2to3.fixes.fix_future'])
+        for source, _ in self.cases:
+            self.assertEqual(
+                rewriter.refactor(source),
+                str(tool.refactor_string(source + '\n', 'test'))[:-1],
+            )
+
+    def test_overlapping_edits(self):
+
+        class FixFirstLine(rewrite.Fixer):
+            def get_edits(self, source, tokens):
+                return [rewrite.Edit(0, source.index('\n'), '')]
+
+        rewriter = rewrite.Rewriter([FixFirstLine(), FixFirstLine()])
+        self.assertRaises(ValueError, rewriter.refactor, 'x = 1\n')
+
+
+class BenchmarkCorpusTestCase(unittest.TestCase):
+
+    def test_corpus_triggers_rules(self):
+        for code in bench_flake8_holvi.available_rules():
+            kind, snippet = bench_flake8_holvi.RULES[code]
+            source = bench_flake8_holvi.generate_module(kind, (snippet,), size=3)
+            visitor = HolviVisitor(enabled_codes=[code])
+            visitor.visit(ast.parse(source))
+            self.assertEqual(visitor.violation_codes.count(code), 3, code)
+
+    @unittest.skipIf(not PY3, reason='needs Python 3')
+    def test_py2_only_rules(self):
+        for code in bench_flake8_holvi.PY2_ONLY_RULES:
+            kind, snippet = bench_flake8_holvi.RULES[code]
+            source = bench_flake8_holvi.generate_module(kind, (snippet,), size=3)
+            try:
+                tree = ast.parse(source)
+            except SyntaxError:
+                continue
+            visitor = HolviVisitor(enabled_codes=[code])
+            visitor.visit(tree)
+            self.assertEqual(visitor.violation_codes, [], code)
+
+    def test_compare_results(self):
+        baseline = {'results': {'HLVE302': {'visit': 1.0, 'visit_all': 1.0}}}
+        current = {'results': {
+            'HLVE302': {'visit': 1.05, 'visit_all': 1.5},
+            'HLVE303': {'visit': 1.0},
+        }}
+        self.assertEqual(
+            bench_flake8_holvi.compare_results(baseline, current, threshold=0.1),
+            [('HLVE302', 'visit_all', 1.0, 1.5)],
+        )
+
+    def test_lib2to3_corpus(self):
+        corpus = bench_holvi_lib2to3.generate_corpus(files=4, size=2)
+        self.assertIn('from __future__', corpus[0][1])
+        results = bench_holvi_lib2to3.run_rewrite(corpus)
+        self.assertNotIn('from __future__', results[0])
+        # CRLF sources are left unchanged like in lib2to3.
+        self.assertIn('\r\n', corpus[2][1])
+        self.assertEqual(results[2], corpus[2][1])
+        self.assertNotIn('from __future__', results[3])
+        self.assertIn('\nif TYPE_CHECKING:\n\timport typing\n', results[3])
+
+
+class EnabledCodesTestCase(unittest.TestCase):
+
+    codes = ['HLVE013', 'HLVE302', 'HLVE303', 'HLVW301']
+
+    def get_enabled_codes(self, **kwargs):
+        options = argparse.Namespace(**kwargs)
+        return sorted(get_enabled_codes(options, self.codes))
+
+    def test_defaults(self):
+        self.assertEqual(self.get_enabled_codes(), self.codes)
+        self.assertEqual(
+            self.get_enabled_codes(select=['E', 'F', 'W', 'C90'], ignore=['E121', 'W503']),
+            self.codes,
+        )
+
+    def test_select(self):
+        self.assertEqual(self.get_enabled_codes(select=['HLVE3']), ['HLVE302', 'HLVE303'])
+        self.assertEqual(self.get_enabled_codes(select='E,HLVW'), ['HLVW301'])
+        self.assertEqual(
+            self.get_enabled_codes(select=['E501'], extend_select=['HLVE0']),
+            ['HLVE013'],
+        )
+
+    def test_ignore(self):
+        self.assertEqual(self.get_enabled_codes(ignore=['HLVE3']), ['HLVE013', 'HLVW301'])
+        self.assertEqual(
+            self.get_enabled_codes(ignore=['E121'], extend_ignore=['HLVE']),
+            ['HLVW301'],
+        )
+        # More specific --select wins.
+        self.assertEqual(
+            self.get_enabled_codes(select=['HLVE302'], ignore=['HLVE3']),
+            ['HLVE302'],
+        )
+        self.assertEqual(
+            self.get_enabled_codes(select=['HLV'], ignore=['HLVE3']),
+            ['HLVE013', 'HLVW301'],
+        )
+
+
+class TargetVersionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(HolviChecker.parse_options, argparse.Namespace())
+
+    def test_py3(self):
+        HolviChecker.parse_options(argparse.Namespace(holvi_target_version='py3'))
+        self.assertEqual(
+            sorted(HolviChecker.enabled_codes),
+            sorted(code for code in HolviVisitor.rules if not code.startswith(('HLVE3', 'HLVW3'))),
+        )
+        table = HolviVisitor.get_dispatch_table(HolviChecker.enabled_codes)
+        self.assertIsNone(table[ast.Import])
+        self.assertIsNone(table[ast.ImportFrom])
+        source = 'import urlparse\n"""Docstring."""\nfoo = unicode(bar)\n'
+        self.assertEqual(list(HolviChecker(None, 'test.py', source.splitlines(True)).run()), [])
+
+    def test_py2(self):
+        HolviChecker.parse_options(argparse.Namespace(holvi_target_version='py2'))
+        self.assertIsNone(HolviChecker.enabled_codes)
+        HolviChecker.parse_options(
+            argparse.Namespace(holvi_target_version='py3', select=['HLVE302', 'HLVE013']),
+        )
+        self.assertEqual(HolviChecker.enabled_codes, {'HLVE013'})
+
+
+class StatsTestCase(unittest.TestCase):
+
+    source = textwrap.dedent("""
+    def spam():
+        return unicode(str(eggs))
+    """)
+
+    def test_visitor(self):
+        visitor = StatsVisitor()
+        visitor.visit(ast.parse(self.source))
+        self.assertEqual(visitor.violation_codes, ['HLVE302', 'HLVE303'])
+        self.assertEqual(visitor.node_counts['Call'], 2)
+        self.assertEqual(visitor.node_counts['FunctionDef'], 1)
+        self.assertEqual(visitor.check_stats['check_unicode_call'][0], 2)
+        self.assertEqual(visitor.check_stats['check_str_call'][0], 2)
+        self.assertEqual(visitor.check_stats['check_empty_docstring'][0], 2)
+        self.assertNotIn('check_assert', visitor.check_stats)
+
+    def test_recorder(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'stats.json')
+        self.addCleanup(os.environ.pop, 'HOLVI_STATS', None)
+        HolviChecker.stats = recorder = StatsRecorder(path)
+        self.addCleanup(setattr, HolviChecker, 'stats', None)
+        lines = self.source.splitlines(True)
+        for filename in ('a.py', 'b.py'):
+            list(HolviChecker(None, filename, lines).run())
+        recorder.write()
+        self.assertFalse(os.path.exists(recorder.parts_directory))
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(sorted(report['files']), ['a.py', 'b.py'])
+        self.assertEqual(report['totals']['files'], 2)
+        self.assertEqual(report['violations'], {'HLVE302': 2, 'HLVE303': 2})
+        self.assertEqual(report['checks']['check_unicode_call']['calls'], 4)
+        self.assertEqual(report['nodes']['Call'], 4)
+
+    def test_recorder_parts(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'stats.json')
+        self.addCleanup(os.environ.pop, 'HOLVI_STATS', None)
+        recorder = StatsRecorder(path)
+        recorder.record('a.py')
+        # Another run with the same path doesn't remove the records.
+        other = StatsRecorder(path)
+        self.assertNotEqual(other.parts_directory, recorder.parts_directory)
+        self.assertEqual(len(os.listdir(recorder.parts_directory)), 1)
+        # Worker processes that parse the options again share the directory
+        # of their run.
+        parent = os.environ['HOLVI_STATS']
+        os.environ['HOLVI_STATS'] = '0' + parent[parent.index(':'):]
+        worker = StatsRecorder(path)
+        self.assertEqual(worker.parts_directory, other.parts_directory)
+        worker._write_at_exit()
+        self.assertTrue(os.path.isdir(other.parts_directory))
+        recorder.write()
+        other.write()
+        self.assertEqual(os.listdir(directory), ['stats.json'])
+
+
+class NoqaMapTestCase(unittest.TestCase):
+
+    def test_build_noqa_map(self):
+        lines = [
+            'foo = 1  # noqa\n',
+            'bar = 2  # noqa: HLVE302, hlve303\n',
+            'baz = "# noqa"\n',
+            '# regular comment\n',
+        ]
+        self.assertEqual(build_noqa_map(lines), (False, {1: None, 2: ('HLVE302', 'HLVE303')}))
+        self.assertEqual(build_noqa_map(['foo = 1\n']), (False, {}))
+        self.assertEqual(build_noqa_map(['# flake8: noqa\n', 'foo = 1  # noqa\n']), (True, {}))
+
+    def test_tokenize_error(self):
+        lines = ['foo = (  # noqa: HLVE302\n']
+        self.assertEqual(build_noqa_map(lines), (False, {1: ('HLVE302',)}))
+
+
+class ViolationTestCase(unittest.TestCase):
+
+    def test_lazy_message(self):
+        visitor = HolviVisitor()
+        visitor.visit(ast.parse('import urlparse\n'))
+        violation, = visitor.violations
+        self.assertEqual((violation.lineno, violation.col_offset), (1, 0))
+        self.assertEqual(violation.code, 'HLVE309')
+        self.assertEqual(violation.args, ('urlparse', 'urllib.parse'))
+        self.assertEqual(
+            violation.message,
+            "HLVE309 Replace Python 2-only import 'urlparse' with six.moves.urllib.parse.",
+        )
+
+
+class SourcePrefilterTestCase(unittest.TestCase):
+
+    def test_live_rules(self):
+        prefilter = SourcePrefilter(HolviVisitor.rules)
+        self.assertEqual(prefilter.live_rules('foo = 42\n'), set())
+        self.assertEqual(prefilter.live_rules('foo = unicode(bar)\n'), {'HLVE302', 'HLVW301'})
+        self.assertEqual(
+            prefilter.live_rules('import urlparse\nfoo.iteritems()\n'),
+            {'HLVE309', 'HLVE314'},
+        )
+        self.assertEqual(prefilter.live_rules('def foo():\n    """\n    """\n'), {'HLVE013'})
+        self.assertEqual(prefilter.live_rules('x = exc.message\n'), {'HLVE313'})
+        self.assertEqual(prefilter.live_rules('import __builtin__\n'), {'HLVE309'})
+        # Words are only matched as a whole.
+        self.assertEqual(prefilter.live_rules('strict = unicodedata\n'), set())
+
+    def test_skip_walk(self):
+        lines = ['foo = bar\n']
+        plugin = HolviChecker(None, None, lines)
+        self.assertEqual(list(plugin.run()), [])
+        # The source didn't need to be parsed.
+        self.assertIsNone(plugin.tree)
+
+
+class CollectStringLiteralsTestCase(unittest.TestCase):
+
+    def test_nested_blocks(self):
+        source = textwrap.dedent("""
+        def test_get(self):
+            foo = 'foo'
+            if spam:
+                bar = baz = 'bar'
+            try:
+                pass
+            except Exception:
+                qux = 'qux'
+            def inner():
+                eggs = 'eggs'
+            number = 42
+        """)
+        func = ast.parse(source).body[0]
+        self.assertEqual(collect_string_literals(func.body), {
+            'foo': ['foo'],
+            'bar': ['bar'],
+            'baz': ['bar'],
+            'qux': ['qux'],
+        })
+
+
+class ContextTrackingTestCase(unittest.TestCase):
+
+    def test_stacks(self):
+        source = textwrap.dedent("""
+        class Spam(object):
+            def eggs(self):
+                for i in range(3):
+                    try:
+                        pass
+                    except Exception:
+                        pass
+        """)
+        seen = []
+
+        class Visitor(HolviVisitor):
+            def visit_Pass(self, node):
+                seen.append((
+                    [n.name for n in self.classes],
+                    [n.name for n in self.functions],
+                    len(self.loops),
+                    len(self.except_handlers),
+                ))
+
+        visitor = Visitor()
+        visitor.visit(ast.parse(source))
+        self.assertEqual(seen, [
+            (['Spam'], ['eggs'], 1, 0),
+            (['Spam'], ['eggs'], 1, 1),
+        ])
+        self.assertEqual(visitor.classes, [])
+        self.assertEqual(visitor.functions, [])
+        self.assertEqual(visitor.loops, [])
+        self.assertEqual(visitor.except_handlers, [])
+
+
+class IncrementalTestCase(unittest.TestCase):
+
+    source = textwrap.dedent("""\
+    \"\"\"\"\"\"
+    import logging
+
+
+    def spam():
+        return unicode(eggs)
+
+
+    def eggs():
+        return str(spam)
+    """)
+
+    def visit(self, source, previous):
+        visited = []
+
+        class Visitor(HolviVisitor):
+            def visit_FunctionDef(self, node):
+                visited.append(node.name)
+                self.generic_visit(node)
+
+        lines = source.splitlines(True)
+        tree = ast.parse(source)
+        fingerprints = [
+            ''.join(lines[start - 1:end])
+            for start, end in _statement_ranges(tree.body, len(lines))
+        ]
+        visitor = Visitor()
+        statements = visitor.visit_incremental(tree, fingerprints, previous)
+        expected = HolviVisitor()
+        expected.visit(tree)
+        self.assertEqual(
+            [(v.lineno, v.col_offset, v.message) for v in visitor.violations],
+            [(v.lineno, v.col_offset, v.message) for v in expected.violations],
+        )
+        return visited, statements
+
+    def test_visit_incremental(self):
+        visited, statements = self.visit(self.source, {})
+        self.assertEqual(visited, ['spam', 'eggs'])
+        source = self.source.replace('import logging\n', 'import logging\nimport os\n\n')
+        source = source.replace('str(spam)', 'str(spam) + str(ham)')
+        visited, statements = self.visit(source, statements)
+        self.assertEqual(visited, ['eggs'])
+        visited, _ = self.visit(source, statements)
+        self.assertEqual(visited, [])
+
+    def test_imports(self):
+        _, statements = self.visit(self.source, {})
+        source = self.source.replace('import logging', 'from exceptions import ValidationError')
+        visited, _ = self.visit(source, statements)
+        self.assertEqual(visited, ['spam', 'eggs'])
+
+    def test_checker(self):
+        lines = self.source.splitlines(True)
+        plugin = HolviChecker(None, 'a.py', lines)
+        plugin.incremental = True
+        expected = list(plugin.run())
+        self.assertEqual([v[2].split()[0] for v in expected], ['HLVE013', 'HLVE302', 'HLVE303'])
+        statements = plugin.statements
+        lines = ['# Comment\n'] + lines
+        lines[6] = lines[6].replace('\n', '  # noqa: HLVE302\n')
+        plugin = HolviChecker(None, 'a.py', lines)
+        plugin.incremental = True
+        plugin.statements = statements
+        self.assertEqual(list(plugin.run()), list(HolviChecker(None, 'a.py', lines).run()))
+        self.assertEqual([v[2].split()[0] for v in plugin.run()], ['HLVE013', 'HLVE303'])
+
+
+class StreamingTestCase(unittest.TestCase):
+
+    source = textwrap.dedent("""\
+    import urlparse
+
+
+    @decorator(unicode(x))
+    class Tests(TestCase):
+        def test_spam(self):
+            for x in y:
+                self.assertEquals(unicode(x), 1)  # noqa
+            else:
+                str(x)
+            try:
+                pass
+            except Exception:
+                unicode(x)
+
+        def test_eggs(self):
+            \"\"\"\"\"\"
+            str(unicode(x))
+    """)
+
+    def test_iter_violations(self):
+        tree = ast.parse(self.source)
+        expected = HolviVisitor()
+        expected.visit(tree)
+        visitor = HolviVisitor()
+        violations = visitor.iter_violations(tree)
+        first = next(violations)
+        self.assertEqual((first.lineno, first.code), (1, 'HLVE309'))
+        self.assertEqual(visitor.violations, [])
+        self.assertEqual(
+            [(v.lineno, v.col_offset, v.code) for v in [first] + list(violations)],
+            [(v.lineno, v.col_offset, v.code) for v in expected.violations],
+        )
+
+    def test_max_violations(self):
+        self.addCleanup(HolviChecker.parse_options, argparse.Namespace())
+
+        def check(max_violations):
+            HolviChecker.parse_options(argparse.Namespace(holvi_max_violations=max_violations))
+            return [v[0] for v in HolviChecker(None, 'test.py', self.source.splitlines(True)).run()]
+
+        self.assertEqual(check(0), [1, 10, 14, 17, 18, 18, 4])
+        self.assertEqual(check(3), [1, 10, 14])
+
+
+class DispatchTableTestCase(unittest.TestCase):
+
+    def test_table(self):
+        table = HolviVisitor.get_dispatch_table()
+        self.assertIs(table, HolviVisitor.get_dispatch_table())
+        self.assertIsNotNone(table[ast.Call])
+        self.assertIsNone(table[ast.Name])
+
+    def test_enabled_codes(self):
+        table = HolviVisitor.get_dispatch_table(['HLVE016'])
+        self.assertIsNotNone(table[ast.Assert])
+        self.assertIsNone(table[ast.Call])
+        self.assertEqual(HolviVisitor.get_checks(['HLVE016']), {
+            'Assert': (HolviVisitor.check_assert,),
+        })
+        self.assertEqual(HolviVisitor.get_checks(['HLVE309', 'HLVE311', 'HLVE313'])['ImportFrom'], (
+            HolviVisitor.check_python2_import,
+            HolviVisitor.check_implicit_relative_import,
+            HolviVisitor.collect_import_from,
+        ))
+
+        # Codes reported by the same check are filtered too.
+        visitor = HolviVisitor(enabled_codes=['HLVW301'])
+        visitor.visit(ast.parse("foo = unicode('bar')\n"))
+        self.assertEqual(visitor.violation_codes, ['HLVW301'])
+
+    def test_rules(self):
+        for code, rule in HolviVisitor.rules.items():
+            self.assertIsNotNone(HolviVisitor.get_message(code), code)
+            for node_type_name, check_name in rule.subscriptions:
+                self.assertTrue(hasattr(ast, node_type_name) or node_type_name == 'Print')
+                self.assertTrue(callable(getattr(HolviVisitor, check_name)))
+
+    def test_subclass(self):
+        class NameVisitor(HolviVisitor):
+            def visit_Name(self, node):
+                self.report_error(node, 'HLVE302')
+                self.generic_visit(node)
+
+        visitor = NameVisitor()
+        visitor.visit(ast.parse('foo = bar\n'))
+        self.assertEqual(visitor.violation_codes, ['HLVE302', 'HLVE302'])
+        self.assertIsNone(HolviVisitor.get_dispatch_table()[ast.Name])